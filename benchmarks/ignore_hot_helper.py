@@ -0,0 +1,25 @@
+""" Many shown functions that each call an ignored helper many times, to benchmark the cost of
+ignoring a call, which shouldn't grow with the number of functions shown. """
+
+import invocation_tree as ivt
+
+function_count = 60
+helper_calls = 50
+
+def helper(n):
+    return sum(range(n))
+
+source = ''.join(f'''
+def step{i}(n):
+    for _ in range(helper_calls):
+        helper(n)
+    return step{i + 1}(n)
+''' for i in range(function_count)) + f'''
+def step{function_count}(n):
+    return n
+'''
+exec(compile(source, __file__, 'exec')) # a code object per function
+
+tree = ivt.debugger()
+tree.ignore_calls.add('helper')
+tree(step0, 10)
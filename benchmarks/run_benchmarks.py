@@ -0,0 +1,316 @@
+""" Benchmarks invocation_tree on the example programs in 'src/' and the generators in 'images/'
+in each mode, and compares the results with a stored baseline.
+
+    python benchmarks/run_benchmarks.py                      # run all, compare with baseline.json
+    python benchmarks/run_benchmarks.py --save-baseline      # run all, store as baseline.json
+    python benchmarks/run_benchmarks.py --programs quick_sort sudoku --modes gif --renderer svg
+
+Each (program, mode) runs in a fresh subprocess. It first times the program untraced, then
+traced, and reports per run as JSON: the events that reach the tree per second, the tracer
+overhead relative to the untraced run, the time spent generating DOT and rendering, the peak
+memory of Python allocations (in a separate run without rendering) and the node count. The
+fastest of '--repeat' runs is used. """
+
+import argparse
+import ast
+import builtins
+import contextlib
+import datetime
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+benchmarks_dir = os.path.dirname(os.path.abspath(__file__))
+package_root = os.path.dirname(benchmarks_dir)
+src_dir = os.path.join(package_root, 'src')
+images_dir = os.path.join(package_root, 'images')
+default_baseline = os.path.join(benchmarks_dir, 'baseline.json')
+
+# name -> (script, argv), 'src' scripts get the tree injected as global 'ivt_tree' and are
+# traced as a whole, 'images' scripts create their tree themselves with an ivt factory
+programs = {
+    'quick_sort': (os.path.join(src_dir, 'quick_sort.py'), []),
+    'quick_sort_fast': (os.path.join(src_dir, 'quick_sort_fast.py'), []),
+    'merge_sort': (os.path.join(src_dir, 'merge_sort.py'), []),
+    'permutations_collect': (os.path.join(src_dir, 'permutations_collect.py'), []),
+    'permutations_neighbor': (os.path.join(src_dir, 'permutations_neighbor.py'), []),
+    'permutations_return': (os.path.join(src_dir, 'permutations_return.py'), []),
+    'jugs_breadth_first': (os.path.join(src_dir, 'jugs_breadth_first.py'), ['4', '3,5']),
+    'jugs_depth_first': (os.path.join(src_dir, 'jugs_depth_first.py'), []),
+    'sudoku': (os.path.join(src_dir, 'sudoku.py'), []),
+    'tower_of_hanoi': (os.path.join(src_dir, 'tower_of_hanoi.py'), []),
+    'images/compute': (os.path.join(images_dir, 'compute.py'), []),
+    'images/factorial': (os.path.join(images_dir, 'factorial.py'), []),
+    'images/jugs_depth_first': (os.path.join(images_dir, 'jugs_depth_first.py'), []),
+    'images/permutations': (os.path.join(images_dir, 'permutations.py'), []),
+    'images/permutations_collect': (os.path.join(images_dir, 'permutations_collect.py'), []),
+    'images/permutations_neighbor': (os.path.join(images_dir, 'permutations_neighbor.py'), []),
+    'images/permutations_return': (os.path.join(images_dir, 'permutations_return.py'), []),
+    'images/quick_sort': (os.path.join(images_dir, 'quick_sort.py'), []),
+    'images/students': (os.path.join(images_dir, 'students.py'), []),
+    'ignore_hot_helper': (os.path.join(benchmarks_dir, 'ignore_hot_helper.py'), []),
+}
+
+modes = ('blocking', 'non_blocking', 'gif', 'debugger_no_render', 'decorator', 'decorate_profile')
+decorator_modes = {'decorator': 'show', 'decorate_profile': 'decorate_profile'}
+factories = ('blocking', 'blocking_each_change', 'debugger', 'debugger_no_render',
+             'gif', 'gif_each_change', 'non_blocking')
+
+# metrics compared with the baseline, lower is better, -> the time they are about, as growth of
+# very short times is mostly noise
+compared_metrics = {'overhead': 'trace_time', 'dot_time': 'dot_time', 'render_time': 'render_time',
+                    'peak_memory': None}
+
+
+# ------ child process, runs one program in one mode ------
+
+def new_tree(ivt, mode, filename, backend, renderer):
+    """ Returns the tree of 'mode', that never opens a viewer. """
+    if mode == 'blocking':
+        tree = ivt.blocking(filename)
+    elif mode == 'non_blocking':
+        tree = ivt.non_blocking(filename)
+    elif mode == 'gif':
+        tree = ivt.gif(os.path.splitext(filename)[0] + '.png')
+    else:
+        tree = ivt.debugger_no_render(filename)
+    tree.show = False
+    tree.backend = backend
+    tree.renderer = renderer
+    return tree
+
+def untraced(tree):
+    """ Makes calling 'tree' run the function without tracing it. """
+    tree.start_trace = lambda: None
+    tree.stop_trace = lambda: None
+    return tree
+
+def decorate_functions(module_ast, decorator):
+    """ Adds '@ivt.<decorator>' to the functions defined at the top level of 'module_ast'. """
+    for stmt in module_ast.body:
+        if isinstance(stmt, ast.FunctionDef):
+            stmt.decorator_list.insert(0, ast.Attribute(value=ast.Name(id='ivt', ctx=ast.Load()),
+                                                        attr=decorator, ctx=ast.Load()))
+    module_ast.body.insert(0, ast.Import(names=[ast.alias(name='invocation_tree', asname='ivt')]))
+    return ast.fix_missing_locations(module_ast)
+
+class Instrumented:
+    """ Counts the steps that reach 'tree' and times its graph creation and rendering. """
+
+    def __init__(self, tree):
+        self.events = 0
+        self.dot_time = 0.0
+        self.render_time = 0.0
+        self.wrap(tree, 'output_graph', 'events')
+        self.wrap(tree, 'create_graph', 'dot_time')
+        self.wrap(tree, 'render_graph', 'render_time')
+
+    def wrap(self, tree, method_name, metric):
+        method = getattr(tree, method_name)
+        if metric == 'events':
+            def counted(*args):
+                self.events += 1
+                return method(*args)
+            setattr(tree, method_name, counted)
+        else:
+            def timed(*args):
+                start = time.perf_counter()
+                try:
+                    return method(*args)
+                finally:
+                    setattr(self, metric, getattr(self, metric) + time.perf_counter() - start)
+            setattr(tree, method_name, timed)
+
+def run_program(ivt, program, mode, traced, backend, renderer, render=True):
+    """ Runs 'program' once and returns (seconds, tree, Instrumented), the tree and Instrumented
+    are None if not 'traced'. """
+    script, argv = programs[program]
+    is_src = os.path.dirname(script) == src_dir
+    with open(script, encoding='utf-8') as file:
+        module_ast = ast.parse(file.read(), script)
+    decorator = decorator_modes.get(mode)
+    if decorator is not None:
+        module_ast = decorate_functions(module_ast, decorator)
+    code = compile(module_ast, script, 'exec')
+    tree = new_tree(ivt, mode, 'tree.pdf', backend, renderer)
+    tree.render = tree.render and render
+    if not traced or decorator is not None:
+        untraced(tree)
+    instrumented = Instrumented(tree) if traced else None
+    ivt.decorator_tree = tree if traced and decorator is not None else None
+    namespace = {'__name__': '__main__', '__file__': script, '__builtins__': builtins}
+    saved_factories = {name: getattr(ivt, name) for name in factories}
+    if is_src:
+        namespace['ivt_tree'] = tree
+    else: # the program gets the benchmarked tree from any factory
+        for name in factories:
+            setattr(ivt, name, lambda *args, **kwargs: tree)
+    sys.argv = [script] + argv
+    random.seed(0)
+    start = time.perf_counter()
+    try:
+        if is_src:
+            tree(exec, code, namespace)
+        else:
+            exec(code, namespace)
+        if traced:
+            tree.get_graph() # a deferred graph is created now
+    finally:
+        seconds = time.perf_counter() - start
+        for name, factory in saved_factories.items():
+            setattr(ivt, name, factory)
+        ivt.decorator_tree = None
+    return seconds, (tree if traced else None), instrumented
+
+def benchmark(program, mode, repeat, backend, renderer):
+    """ Returns the result dict of 'program' in 'mode'. """
+    script, argv = programs[program]
+    sys.path[:0] = [os.path.dirname(script), src_dir]
+    sys.setrecursionlimit(10000)
+    import invocation_tree as ivt
+    builtins.input = lambda prompt='': '' # answers blocking mode
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+        run_program(ivt, program, mode, False, backend, renderer) # warm up imports and caches
+        baseline_time = min(run_program(ivt, program, mode, False, backend, renderer)[0]
+                            for _ in range(repeat))
+        runs = [run_program(ivt, program, mode, True, backend, renderer) for _ in range(repeat)]
+        traced_time, tree, instrumented = min(runs, key=lambda run: run[0])
+        tracemalloc.start() # slows allocations down a lot, so measured without rendering
+        run_program(ivt, program, mode, True, backend, renderer, render=False)
+        peak_memory = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+    trace_time = traced_time - instrumented.dot_time - instrumented.render_time
+    return {
+        'events': instrumented.events,
+        'events_per_sec': instrumented.events / trace_time if trace_time > 0 else None,
+        'baseline_time': baseline_time,
+        'traced_time': traced_time,
+        'trace_time': trace_time,
+        'overhead': trace_time / baseline_time if baseline_time > 0 else None,
+        'dot_time': instrumented.dot_time,
+        'render_time': instrumented.render_time,
+        'peak_memory': peak_memory,
+        'node_count': tree.node_count,
+    }
+
+def child_main(args):
+    try:
+        result = benchmark(args.child[0], args.child[1], args.repeat, args.backend, args.renderer)
+    except BaseException as e: # a program that exits or fails is reported, not fatal
+        result = {'error': f'{type(e).__name__}: {e}'}
+    sys.__stdout__.write(json.dumps(result) + '\n')
+
+
+# ------ parent process ------
+
+def run_child(program, mode, args):
+    command = [sys.executable, os.path.abspath(__file__), '--child', program, mode,
+               '--repeat', str(args.repeat), '--backend', args.backend, '--renderer', args.renderer]
+    env = dict(os.environ, PYTHONHASHSEED='0')
+    env['PYTHONPATH'] = os.pathsep.join(filter(None, [package_root, env.get('PYTHONPATH')]))
+    with tempfile.TemporaryDirectory() as work_dir: # for the rendered files
+        completed = subprocess.run(command, cwd=work_dir, env=env, capture_output=True, text=True,
+                                   timeout=args.timeout)
+    lines = completed.stdout.strip().splitlines()
+    if completed.returncode != 0 or not lines:
+        return {'error': (completed.stderr.strip().splitlines() or ['no output'])[-1]}
+    return json.loads(lines[-1])
+
+def compare(results, baseline, threshold, min_time):
+    """ Returns the regressions of 'results' compared to 'baseline', metrics that grew more than
+    'threshold' (a fraction) and 'min_time' seconds, and node counts that changed. """
+    baseline_results = {(r['program'], r['mode']): r for r in baseline['results']}
+    regressions = []
+    for result in results:
+        old = baseline_results.get((result['program'], result['mode']))
+        if old is None or 'error' in result or 'error' in old:
+            continue
+        name = f"{result['program']} {result['mode']}"
+        if result['node_count'] != old['node_count']:
+            regressions.append(f"{name}: node_count {old['node_count']} -> {result['node_count']}")
+        for metric, time_metric in compared_metrics.items():
+            if time_metric is not None and result[time_metric] - old[time_metric] <= min_time:
+                continue
+            if old[metric] and result[metric] is not None and result[metric] > old[metric] * (1 + threshold):
+                regressions.append(f"{name}: {metric} {old[metric]:.4g} -> {result[metric]:.4g} "
+                                   f"(+{result[metric] / old[metric] - 1:.0%})")
+    return regressions
+
+def print_header():
+    print(f"{'program':30} {'mode':18} {'events':>7} {'events/s':>9} {'overhead':>8} "
+          f"{'dot s':>7} {'render s':>8} {'peak KiB':>9} {'nodes':>6}")
+
+def print_result(r):
+    if 'error' in r:
+        print(f"{r['program']:30} {r['mode']:18} error: {r['error']}")
+        return
+    events_per_sec = f"{r['events_per_sec']:9.0f}" if r['events_per_sec'] else f"{'-':>9}"
+    overhead = f"{r['overhead']:7.1f}x" if r['overhead'] else f"{'-':>8}"
+    print(f"{r['program']:30} {r['mode']:18} {r['events']:7} {events_per_sec} {overhead} "
+          f"{r['dot_time']:7.3f} {r['render_time']:8.3f} {r['peak_memory']/1024:9.0f} {r['node_count']:6}")
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmarks invocation_tree on the example programs.')
+    parser.add_argument('--programs', nargs='+', choices=programs, default=list(programs))
+    parser.add_argument('--modes', nargs='+', choices=modes, default=list(modes))
+    parser.add_argument('--repeat', type=int, default=3, help='runs per measurement, the fastest is used')
+    parser.add_argument('--backend', default='settrace', choices=('settrace', 'monitoring'))
+    parser.add_argument('--renderer', default='graphviz', choices=('graphviz', 'svg'))
+    parser.add_argument('--timeout', type=float, default=600, help='seconds per program and mode')
+    parser.add_argument('--output', help='write the results as JSON to this file')
+    parser.add_argument('--baseline', default=default_baseline, help='baseline JSON to compare with')
+    parser.add_argument('--save-baseline', action='store_true', help='store the results as the baseline')
+    parser.add_argument('--threshold', type=float, default=0.2, help='allowed growth of a metric, 0.2 is 20%%')
+    parser.add_argument('--min-time', type=float, default=0.005, help='allowed growth of a time in seconds')
+    parser.add_argument('--child', nargs=2, metavar=('PROGRAM', 'MODE'), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.child:
+        child_main(args)
+        return
+    results = []
+    print_header()
+    for program in args.programs:
+        for mode in args.modes:
+            try:
+                result = run_child(program, mode, args)
+            except subprocess.TimeoutExpired:
+                result = {'error': f'timeout after {args.timeout:g}s'}
+            results.append(dict(program=program, mode=mode, **result))
+            print_result(results[-1])
+    report = {
+        'meta': {
+            'date': datetime.datetime.now().isoformat(timespec='seconds'),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'backend': args.backend,
+            'renderer': args.renderer,
+            'repeat': args.repeat,
+        },
+        'results': results,
+    }
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as file:
+            json.dump(report, file, indent=1)
+    if args.save_baseline:
+        with open(args.baseline, 'w', encoding='utf-8') as file:
+            json.dump(report, file, indent=1)
+        print(f'baseline stored in {args.baseline}')
+    elif os.path.exists(args.baseline):
+        with open(args.baseline, encoding='utf-8') as file:
+            baseline = json.load(file)
+        regressions = compare(results, baseline, args.threshold, args.min_time)
+        print(f"compared with baseline of {baseline['meta']['date']} (python {baseline['meta']['python']})")
+        for regression in regressions:
+            print('REGRESSION', regression)
+        if regressions:
+            sys.exit(1)
+        print('no regressions')
+
+if __name__ == '__main__':
+    main()
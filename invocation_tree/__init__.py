@@ -3,16 +3,42 @@
 # SPDX-License-Identifier: BSD-2-Clause
 
 from graphviz import Digraph, Source
+import graphviz
 import html
 import sys
+import os
 import difflib 
 import functools
+import atexit
+import time
+import re
 
 import invocation_tree.regex_set as regset
+import invocation_tree.monitoring as monitoring
+import invocation_tree.code_info as code_info
+import invocation_tree.versioned as versioned
+import invocation_tree.dot_source as dot_source
+import invocation_tree.svg_render as svg_render
+import invocation_tree.event_log as event_log
+import invocation_tree.time_travel as time_travel
+import invocation_tree.structural_diff as structural_diff
+import invocation_tree.phase_stats as phase_stats
+import invocation_tree.profiling as profiling
+import invocation_tree.aggregation as aggregation
+import invocation_tree.flame_graph as flame_graph
+import invocation_tree.viewport as viewport
+import invocation_tree.folding as folding
+import invocation_tree.span_export as span_export
+import invocation_tree.snapshots as snapshots
+import invocation_tree.breakpoints as breakpoints
+import invocation_tree.notebook as notebook
+from invocation_tree.bounded_str import budgeted, tail_str
 
 __version__ = "0.0.41"
 __author__ = 'Bas Terwijn'
 
+package_dir = os.path.dirname(os.path.abspath(__file__))
+
 # colors dark
 foreground_color_light = '#000000'
 background_color_light = '#ffffff'
@@ -33,26 +59,61 @@ background_color_PH = '<background_color_PH>'
 color_paused_PH = '<color_paused_PH>'
 color_active_PH = '<color_active_PH>'
 color_returned_PH = '<color_returned_PH>'
+color_placeholders = (foreground_color_PH, background_color_PH, color_paused_PH, color_active_PH, color_returned_PH)
+
+missing = object()
+
+cell_alignment = 'ALIGN="LEFT" BALIGN="LEFT"'
 
 
+max_char_diff_len = 1000 # longer differences are diffed by token instead of by character
+token_regex = re.compile(r'\w+|\s+|&[#\w]+;|.', re.S)
+
+def common_prefix_len(str1, str2, max_len):
+    low, high = 0, max_len
+    while low < high: # binary search so slices compare in C
+        mid = (low + high + 1) // 2
+        if str1[:mid] == str2[:mid]:
+            low = mid
+        else:
+            high = mid - 1
+    return low
+
+def common_suffix_len(str1, str2, max_len):
+    low, high = 0, max_len
+    while low < high:
+        mid = (low + high + 1) // 2
+        if str1[len(str1)-mid:] == str2[len(str2)-mid:]:
+            low = mid
+        else:
+            high = mid - 1
+    return low
+
 def highlight_diff(str1, str2):
-    matcher = difflib.SequenceMatcher(None, str1, str2)
-    result = []
-    is_highlighted = False
+    """ Diffs just the part between the common prefix and suffix, by character or for long
+    differences by token as SequenceMatcher is quadratic in the worst case. """
+    if str1 == str2:
+        return str2, False
+    prefix_len = common_prefix_len(str1, str2, min(len(str1), len(str2)))
+    suffix_len = common_suffix_len(str1, str2, min(len(str1), len(str2)) - prefix_len)
+    mid1 = str1[prefix_len:len(str1)-suffix_len]
+    mid2 = str2[prefix_len:len(str2)-suffix_len]
+    if len(mid1) + len(mid2) > max_char_diff_len:
+        mid1 = token_regex.findall(mid1)
+        mid2 = token_regex.findall(mid2)
+    matcher = difflib.SequenceMatcher(None, mid1, mid2)
+    result = [str2[:prefix_len]]
     for tag, i1, i2, j1, j2 in matcher.get_opcodes():
         if tag == 'replace':
-            result.append(f'<B>{str2[j1:j2]}&#8203;</B>&#8203;')
-            is_highlighted = True
+            result.append(f'<B>{"".join(mid2[j1:j2])}&#8203;</B>&#8203;')
         elif tag == 'delete':
-            result.append(f'<FONT COLOR="#aaaaaa"><S>{str1[i1:i2]}&#8203;</S></FONT>&#8203;')
-            is_highlighted = True
+            result.append(f'<FONT COLOR="#aaaaaa"><S>{"".join(mid1[i1:i2])}&#8203;</S></FONT>&#8203;')
         elif tag == 'insert':
-            result.append(f'<B>{str2[j1:j2]}&#8203;</B>&#8203;')
-            is_highlighted = True
+            result.append(f'<B>{"".join(mid2[j1:j2])}&#8203;</B>&#8203;')
         elif tag == 'equal':
-            result.append(str2[j1:j2])
-    diff = ''.join(result)
-    return diff, is_highlighted
+            result.append(''.join(mid2[j1:j2]))
+    result.append(str2[len(str2)-suffix_len:])
+    return ''.join(result), True
 
 def get_class_function_name(frame):
     class_name = ''
@@ -61,29 +122,55 @@ def get_class_function_name(frame):
     function_name = class_name+frame.f_code.co_name
     return function_name
 
+module_type = type(sys)
+
 def filter_variables(var, val):
-    if callable(val):
+    if var.startswith('__'):
         return False
-    if isinstance(val, (type, type(object), type(__import__('os')))):
+    return filter_value(val)
+
+def filter_value(val):
+    if callable(val):
         return False
-    if var.startswith('__'):
+    if isinstance(val, (type, module_type)):
         return False
     return True
 
 class Tree_Node:
-    node_id = 0
+    """ A function call in the tree. When it has returned and is rendered, freeze() releases
+    its frame and return value and keeps just the rendered strings. """
+    __slots__ = ('node_id', 'frame', 'return_value', 'is_returned', 'strings', 'rows', 'frozen', 'contents', 'snapshots', 'timing', 'aggregate')
 
-    def __init__(self, frame, return_value):
-        self.node_id = Tree_Node.node_id
-        Tree_Node.node_id += 1
+    def __init__(self, node_id, frame, return_value):
+        self.node_id = node_id
         self.frame = frame
         self.return_value = return_value
         self.is_returned = False
         self.strings = {}
+        self.rows = None # (class_fun_name, [(var_name, val_name), ...], return_name) last rendered
+        self.frozen = None # (name_content, ((var_content, val_content), ...), return_content)
+        self.contents = None # recorded (name_content, [(var_content, val_content), ...], return_content)
+        self.snapshots = None # val_name -> structural_diff.Snapshot
+        self.timing = None # profiling.Node_Timing when profiled
+        self.aggregate = None # aggregation.Call_Aggregate of a node that merges calls
 
     def __repr__(self):
         return f'node_id:{self.node_id} frame:{self.frame} return_value:{self.return_value}'
 
+    def freeze(self):
+        strings = self.strings
+        class_fun_name, var_val_names, return_name = self.rows
+        contents = tuple((sys.intern(strings[var_name]), sys.intern(strings[val_name]))
+                         for var_name, val_name in var_val_names)
+        return_content = None if return_name is None else sys.intern(strings[return_name])
+        self.frozen = (sys.intern(strings[class_fun_name]), contents, return_content)
+        self.frame = None
+        self.return_value = None
+        self.strings = None
+        self.rows = None
+        self.contents = None
+        self.snapshots = None
+
 class Invocation_Tree:
 
     def __init__(self, 
@@ -99,7 +186,9 @@ class Invocation_Tree:
                  to_string=None, 
                  hide_vars=None,
                  cleanup=True,
-                 quiet=True):
+                 quiet=True,
+                 backend='settrace',
+                 renderer='graphviz'):
         # --- config
         self.filename = filename
         self.prev_filename = None
@@ -111,20 +200,45 @@ class Invocation_Tree:
         self.gifcount = gifcount
         self.indent = indent
         self.each_line = each_line
-        self.to_string = {}
+        self.to_string = versioned.Versioned_Dict()
         if not to_string is None:
             self.to_string = to_string
-        self.hide_vars = set()
+        self.to_string_tracker = versioned.Change_Tracker()
+        self.type_converters = {}
+        self.highlights = {} # (old, new) content -> highlight_diff(), for values that flip between the same states
+        self.max_highlights = 10000
+        self.has_id_converters = False
+        self.hide_vars = versioned.Versioned_Set()
         if not hide_vars is None:
             self.hide_vars = hide_vars
         self.cleanup = cleanup
         self.quiet = quiet
-        self.hide_calls = {'Invocation_Tree.__exit__', 'Invocation_Tree.stop_trace', '<genexpr>'}
-        self.ignore_calls = set()
-        self.ignoring_call = None
+        self.backend = backend
+        self.renderer = renderer
+        self.structural_diff = False
+        self.aggregate = False
+        self.viewport = False
+        self.viewport_radius = 2
+        self.viewport_history = 10
+        self.fold = False
+        self.recorder = None
+        self.span_writer = None
+        self.history = None
+        self.breakpoints = [] # of breakpoints.Breakpoint, blocking mode stops at every step if empty
+        self.fast_forward = None # breakpoints.Fast_Forward of the last prompt command
+        self.has_skipped_steps = False # blocking mode passed steps without rendering them
+        self.frame_rate = 10 # maximum updates per second of renderer 'jupyter', None for no maximum
+        self.notebook_display = None
+        self.keep_tree = True # False to keep just the active calls, when streaming spans
+        self.phase_stats = None
+        self.profiler = None
+        self.hide_calls = versioned.Versioned_Set({'Invocation_Tree.__exit__', 'Invocation_Tree.stop_trace', '<genexpr>'})
+        self.ignore_calls = versioned.Versioned_Set()
+        self.ignoring_frame = None
         self.regset_hide_vars = regset.Regex_Set(self.hide_vars)
         self.regset_hide_calls = regset.Regex_Set(self.hide_calls)
         self.regset_ignore_calls = regset.Regex_Set(self.ignore_calls)
+        self.code_infos = code_info.Code_Info_Cache(self.classify)
         self.fontname = 'Times-Roman'
         self.fontsize = '14'
         self.in_dark_mode = False
@@ -137,12 +251,17 @@ class Invocation_Tree:
         self.prev_returned = []
         self.paused = []
         self.prev_paused = []
-        self.node_id_to_table = {}
-        self.edges = []
+        self.node_count = 0
+        self.merged_nodes = {} # (parent node_id, class_fun_name) -> Tree_Node, when aggregating
+        self.call_store = flame_graph.Call_Store()
+        self.folds = {} # node_id -> folding.Fold of a returned node
+        self.dot_source = dot_source.Dot_Source(color_placeholders)
         self.is_highlighted = False
         self.graph = None
+        self.is_graph_outdated = False
+        self.max_deferred_returns = 1000
         self.prev_global_tracer = None
-        self.uncolored_graph = None
+        self.monitor = None
         
     def __repr__(self):
         return f'Invocation_Tree(filename={repr(self.filename)}, show={self.show}, block={self.block}, each_line={self.each_line}, gifcount={self.gifcount})'
@@ -185,44 +304,99 @@ class Invocation_Tree:
         self.set_colors()
 
     def __call__(self, fun, *args, **kwargs):
+        self.start_trace()
         try:
-            self.prev_global_tracer = sys.gettrace()
-            sys.settrace(self.global_tracer)
             result = fun(*args, **kwargs)
         finally:
-            sys.settrace(self.prev_global_tracer)
+            self.stop_trace()
         return result
 
-    def value_to_string(self, key, value, is_value):
+    def start_trace(self):
+        """ Starts tracing with the selected backend, 'monitoring' falls back to 'settrace' before Python 3.12. """
+        self.notebook_display = None # each run in a new output area
+        self.highlights.clear()
+        if monitoring.select_backend(self.backend) == 'monitoring':
+            self.monitor = monitoring.Monitor(self)
+            self.monitor.start()
+        else:
+            self.prev_global_tracer = sys.gettrace()
+            sys.settrace(self.global_tracer)
+
+    def stop_trace(self):
+        if self.monitor is not None:
+            self.monitor.stop()
+            self.monitor = None
+        else:
+            sys.settrace(self.prev_global_tracer)
+        if self.recorder is not None:
+            self.recorder.flush()
+        if self.span_writer is not None:
+            self.span_writer.flush()
+        self.fast_forward = None
+        if self.has_skipped_steps: # render the end state once, no stop showed it
+            self.has_skipped_steps = False
+            self.graph = self.create_graph()
+            if self.render and self.graph is not None:
+                self.render_graph(self.graph)
+        if self.notebook_display is not None and self.is_graph_outdated: # show the last throttled frame
+            self.render_graph(self.get_graph())
+
+    def type_converter(self, value_type):
+        """ Returns the to_string function of the first type in the MRO of 'value_type' that has one, or None. """
+        converter = self.type_converters.get(value_type, missing)
+        if converter is missing:
+            converter = None
+            for t in value_type.__mro__:
+                if t in self.to_string:
+                    converter = self.to_string[t]
+                    break
+            self.type_converters[value_type] = converter
+        return converter
+
+    def find_converter(self, key, value, key_converter=missing):
+        """ Returns the to_string function for 'value' named 'key', by id, name and then type, or None. """
+        if not self.to_string:
+            return None
+        if self.has_id_converters:
+            converter = self.to_string.get(id(value))
+            if converter is not None:
+                return converter
+        if key_converter is missing:
+            key_converter = self.to_string.get(key)
+        if key_converter is not None:
+            return key_converter
+        return self.type_converter(type(value))
+
+    def value_to_text(self, key, value, key_converter=missing):
+        """ Returns 'value' named 'key' as plain text of at most about 'max_string_len' characters. """
+        converter = self.find_converter(key, value, key_converter)
         try:
-            if id(value) in self.to_string:
-                val_str = self.to_string[id(value)](value)
-            elif key in self.to_string:
-                val_str = self.to_string[key](value)
-            elif type(value) in self.to_string:
-                val_str = self.to_string[type(value)](value)
+            if converter is None:
+                val_str = tail_str(value, self.max_string_len)
+            elif getattr(converter, 'takes_budget', False):
+                val_str = converter(value, self.max_string_len)
             else:
-                val_str = str(value)
+                val_str = converter(value)
         except Exception as e:
             val_str = '<not-string-convertable>'
         if len(val_str) > self.max_string_len:
             val_str = '...'+val_str[-self.max_string_len:]
-        result = html.escape(val_str)
+        return val_str
+
+    def value_to_string(self, key, value, is_value, key_converter=missing):
+        result = html.escape(self.value_to_text(key, value, key_converter))
         if '\n' in result:
             lines = result.split('\n')
             result = '<BR/>' + '<BR/>'.join([line + '&nbsp;' for line in lines]) # use HTML line breaks
         elif is_value and isinstance(value, str):
             result = "'" + result + "'" # add quotes around single line strings
         return result
-    
-    def get_hightlighted_content(self, tree_node, key, value, use_old_content=False, is_value=False):
-        if use_old_content and key in tree_node.strings:
-            return tree_node.strings[key]
+
+    def highlight_content(self, tree_node, key, content):
         is_highlighted = False
-        content = self.value_to_string(key, value, is_value)
         if key in tree_node.strings:
             use_old_content = tree_node.strings[key]
-            hightlighted_content, is_highlighted = highlight_diff(use_old_content, content)
+            hightlighted_content, is_highlighted = self.cached_highlight_diff(use_old_content, content)
         else:
             if len(content.strip())>0: # fixes graphviz error on empty <B></B> tag
                 hightlighted_content = '<B>'+content+'</B>' 
@@ -232,7 +406,57 @@ class Invocation_Tree:
         tree_node.strings[key] = content
         self.is_highlighted |= is_highlighted
         return hightlighted_content
-    
+
+    def cached_highlight_diff(self, old_content, content):
+        """ Returns highlight_diff() of the contents, cached up to 'max_highlights' pairs. The
+        cache is cleared when a run starts and when the filters change. """
+        if old_content == content:
+            return content, False
+        pair = (old_content, content)
+        highlighted = self.highlights.get(pair)
+        if highlighted is None:
+            if len(self.highlights) >= self.max_highlights:
+                self.highlights.clear()
+            highlighted = self.highlights[pair] = highlight_diff(old_content, content)
+        return highlighted
+
+    def highlight_container(self, tree_node, key, value):
+        """ Returns the content of container 'value' with the elements that changed since it was
+        last shown highlighted, see structural_diff.highlight_container(). """
+        if tree_node.snapshots is None:
+            tree_node.snapshots = {}
+        snapshot = tree_node.snapshots.get(key)
+        hightlighted_content, content, tree_node.snapshots[key], is_highlighted = \
+            structural_diff.highlight_container(value, snapshot, self.max_string_len)
+        if snapshot is None and key in tree_node.strings: # shown before without structural diff
+            return self.highlight_content(tree_node, key, content)
+        tree_node.strings[key] = content
+        self.is_highlighted |= is_highlighted
+        return hightlighted_content
+
+    def get_render_plan(self, info, local_vars):
+        """ Returns the Render_Plan for a frame of 'info' with variables 'local_vars'. """
+        var_names = tuple(local_vars)
+        plan = info.plans.get(var_names)
+        if plan is None:
+            plan = info.plans[var_names] = self.make_render_plan(info.class_fun_name, var_names)
+        return plan
+
+    def make_render_plan(self, class_fun_name, var_names):
+        rows = []
+        for var in var_names:
+            var_name = class_fun_name+'..'+var
+            val_name = class_fun_name+'.'+var
+            if not var.startswith('__') and not self.regset_hide_vars.match(val_name, self.hide_vars):
+                var_content = self.value_to_string(var_name, var, False)
+                rows.append((var, var_name, val_name, var_content, self.to_string.get(val_name)))
+        return_name = class_fun_name+'.return'
+        return code_info.Render_Plan(self.value_to_string(class_fun_name, class_fun_name, False),
+                                     rows,
+                                     return_name,
+                                     self.to_string.get(return_name),
+                                     not self.regset_hide_vars.match(return_name, self.hide_vars))
+
     def build_html_table(self, tree_node, active=False, is_returned=None, use_old_content=False):
         if is_returned is None:
             is_returned = tree_node.is_returned
@@ -246,36 +470,182 @@ class Invocation_Tree:
             border = 3
         if is_returned:
             color = color_returned_PH
-        alignment = 'ALIGN="LEFT" BALIGN="LEFT"'
+        alignment = cell_alignment
         table = f'<\n<TABLE BORDER="{str(border)}" COLOR={foreground_color_PH} CELLBORDER="0" CELLSPACING="0" BGCOLOR={color}>\n  <TR>'
-        class_fun_name = get_class_function_name(tree_node.frame)
+        if tree_node.frozen is not None:
+            return table + self.frozen_table_rows(tree_node.frozen, alignment, self.extra_rows(tree_node, alignment))
+        if tree_node.contents is not None:
+            return table + self.recorded_table_rows(tree_node, is_returned, use_old_content, alignment)
+        info = self.code_infos.get(tree_node.frame)
+        class_fun_name = info.class_fun_name
         local_vars = tree_node.frame.f_locals
-        hightlighted_content = self.get_hightlighted_content(tree_node, class_fun_name, class_fun_name, use_old_content)
+        plan = self.get_render_plan(info, local_vars)
+        strings = tree_node.strings
+        var_val_names = []
+        if use_old_content and class_fun_name in strings:
+            hightlighted_content = strings[class_fun_name]
+        else:
+            hightlighted_content = self.highlight_content(tree_node, class_fun_name, plan.name_content)
         table += '<TD '+alignment+'>'+ '➤'+ hightlighted_content +'</TD>'
-        for var,val in local_vars.items():
-            var_name = class_fun_name+'..'+var
-            val_name = class_fun_name+'.'+var
-            if filter_variables(var,val) and not self.regset_hide_vars.match(val_name, self.hide_vars):
+        for var, var_name, val_name, var_content, key_converter in plan.rows:
+            val = local_vars[var]
+            if filter_value(val):
                 table += '</TR>\n  <TR>'
-                hightlighted_var = self.get_hightlighted_content(tree_node, var_name, var, use_old_content)
-                hightlighted_val = self.get_hightlighted_content(tree_node, val_name, val, use_old_content, is_value=True)
+                if use_old_content and var_name in strings:
+                    hightlighted_var = strings[var_name]
+                else:
+                    hightlighted_var = self.highlight_content(tree_node, var_name, var_content)
+                if use_old_content and val_name in strings:
+                    hightlighted_val = strings[val_name]
+                elif (self.structural_diff and type(val) in structural_diff.container_types and
+                      self.find_converter(val_name, val, key_converter) is None):
+                    hightlighted_val = self.highlight_container(tree_node, val_name, val)
+                else:
+                    content = self.value_to_string(val_name, val, True, key_converter)
+                    hightlighted_val = self.highlight_content(tree_node, val_name, content)
                 hightlighted_content = self.indent + hightlighted_var + ': ' + hightlighted_val
                 table += '<TD '+alignment+'>'+ hightlighted_content  +'</TD>'
-        if is_returned:
-            return_name = class_fun_name+'.return'
-            if not self.regset_hide_vars.match(return_name, self.hide_vars):
+                var_val_names.append((var_name, val_name))
+        return_name = None
+        if is_returned and plan.show_return:
+            return_name = plan.return_name
+            table += '</TR>\n  <TR>'
+            if use_old_content and return_name in strings:
+                hightlighted_content = strings[return_name]
+            else:
+                content = self.value_to_string(return_name, return_value, True, plan.return_converter)
+                hightlighted_content = self.highlight_content(tree_node, return_name, content)
+            table += '<TD '+alignment+'>'+ 'return ' + hightlighted_content +'</TD>'
+        if tree_node.aggregate is not None:
+            aggregate_name = class_fun_name+'.<calls>'
+            table += '</TR>\n  <TR>'
+            if use_old_content and aggregate_name in strings:
+                hightlighted_content = strings[aggregate_name]
+            else:
+                content = aggregation.aggregate_content(tree_node.aggregate)
+                hightlighted_content = self.highlight_content(tree_node, aggregate_name, content)
+            table += '<TD '+alignment+'>'+ hightlighted_content +'</TD>'
+            if tree_node.aggregate.samples:
+                samples_name = class_fun_name+'.<samples>'
                 table += '</TR>\n  <TR>'
-                hightlighted_content = self.get_hightlighted_content(tree_node, return_name, return_value, use_old_content, is_value=True)
-                table += '<TD '+alignment+'>'+ 'return ' + hightlighted_content +'</TD>'
+                if use_old_content and samples_name in strings:
+                    hightlighted_content = strings[samples_name]
+                else:
+                    content = aggregation.samples_content(tree_node.aggregate)
+                    hightlighted_content = self.highlight_content(tree_node, samples_name, content)
+                table += '<TD '+alignment+'>'+ hightlighted_content +'</TD>'
+        table += self.extra_rows(tree_node, alignment)
         table += '</TR>\n</TABLE>>'
+        tree_node.rows = (class_fun_name, var_val_names, return_name)
         return table
 
+    def extra_rows(self, tree_node, alignment):
+        """ Returns the rows below the return value, of the times and of what is folded. """
+        return self.timing_row(tree_node, alignment) + self.fold_row(tree_node.node_id, alignment)
+
+    def timing_row(self, tree_node, alignment):
+        """ Returns the row with the times of a profiled node that returned, if any. """
+        timing = tree_node.timing
+        if timing is None or timing.wall is None:
+            return ''
+        return '</TR>\n  <TR><TD '+alignment+'>'+ profiling.timing_content(timing) +'</TD>'
+
+    def fold_row(self, node_id, alignment=cell_alignment):
+        """ Returns the row with the summary of what is folded into a node, if any. """
+        fold = self.folds.get(node_id)
+        if fold is None:
+            return ''
+        return '</TR>\n  <TR><TD '+alignment+'>'+ folding.fold_content(fold) +'</TD>'
+
+    def frozen_table_rows(self, frozen, alignment, extra_rows=''):
+        """ Returns the rows of a table of a frozen node, without any highlighting. """
+        name_content, contents, return_content = frozen
+        table = '<TD '+alignment+'>'+ '➤'+ name_content +'</TD>'
+        for var_content, val_content in contents:
+            table += '</TR>\n  <TR>'
+            table += '<TD '+alignment+'>'+ self.indent + var_content + ': ' + val_content +'</TD>'
+        if return_content is not None:
+            table += '</TR>\n  <TR>'
+            table += '<TD '+alignment+'>'+ 'return ' + return_content +'</TD>'
+        table += extra_rows
+        table += '</TR>\n</TABLE>>'
+        return table
+
+    def recorded_table_rows(self, tree_node, is_returned, use_old_content, alignment):
+        """ Returns the rows of a table of a node replayed from a recording. """
+        name_content, rows, return_content = tree_node.contents
+        strings = tree_node.strings
+
+        def highlighted(key, content):
+            if use_old_content and key in strings:
+                return strings[key]
+            return self.highlight_content(tree_node, key, content)
+
+        table = '<TD '+alignment+'>'+ '➤'+ highlighted(name_content, name_content) +'</TD>'
+        var_val_names = []
+        for var_content, val_content in rows:
+            var_name = name_content+'..'+var_content
+            val_name = name_content+'.'+var_content
+            table += '</TR>\n  <TR>'
+            table += '<TD '+alignment+'>'+ self.indent + highlighted(var_name, var_content) + ': ' + highlighted(val_name, val_content) +'</TD>'
+            var_val_names.append((var_name, val_name))
+        return_name = None
+        if is_returned and return_content is not None:
+            return_name = name_content+'.return'
+            table += '</TR>\n  <TR>'
+            table += '<TD '+alignment+'>'+ 'return ' + highlighted(return_name, return_content) +'</TD>'
+        table += self.extra_rows(tree_node, alignment)
+        table += '</TR>\n</TABLE>>'
+        tree_node.rows = (name_content, var_val_names, return_name)
+        return table
+
+    def node_contents(self, tree_node, is_returned):
+        """ Returns the strings build_html_table() shows for 'tree_node', without highlighting, as
+        (name_content, [(var_content, val_content), ...], return_content). """
+        info = self.code_infos.get(tree_node.frame)
+        local_vars = tree_node.frame.f_locals
+        plan = self.get_render_plan(info, local_vars)
+        rows = [(var_content, self.value_to_string(val_name, local_vars[var], True, key_converter))
+                for var, var_name, val_name, var_content, key_converter in plan.rows
+                if filter_value(local_vars[var])]
+        return_content = None
+        if is_returned and plan.show_return:
+            return_content = self.value_to_string(plan.return_name, tree_node.return_value, True, plan.return_converter)
+        return plan.name_content, rows, return_content
+
+    def node_values(self, tree_node, is_returned):
+        """ Returns the plain text of what build_html_table() shows for 'tree_node' as
+        (class_fun_name, {var: val}, return_value), return_value is None if not shown. """
+        info = self.code_infos.get(tree_node.frame)
+        local_vars = tree_node.frame.f_locals
+        plan = self.get_render_plan(info, local_vars)
+        values = {var: self.value_to_text(val_name, local_vars[var], key_converter)
+                  for var, var_name, val_name, var_content, key_converter in plan.rows
+                  if filter_value(local_vars[var])}
+        return_value = None
+        if is_returned and plan.show_return:
+            return_value = self.value_to_text(plan.return_name, tree_node.return_value, plan.return_converter)
+        return info.class_fun_name, values, return_value
+
+    def write_span(self, tree_node, parent, is_returned):
+        """ Writes the begin or end span of the call of 'tree_node' to the span writer. """
+        name, values, return_value = self.node_values(tree_node, is_returned)
+        parent_id = None if parent is None else parent.node_id
+        if is_returned:
+            self.span_writer.end(tree_node.node_id, parent_id, name, values, return_value, self.clock())
+        else:
+            self.span_writer.begin(tree_node.node_id, parent_id, name, values, self.clock())
+
     def update_node(self, tree_node, active=False, returned=None, use_old_content=False):
         table = self.build_html_table(tree_node, active, returned, use_old_content=use_old_content)
-        self.node_id_to_table[str(tree_node.node_id)] = table
+        self.dot_source.set_table(tree_node.node_id, table)
         
     def add_edge(self, tree_node1, tree_node2):
-        self.edges.append((str(tree_node1.node_id), str(tree_node2.node_id)))
+        if self.recorder is not None:
+            self.recorder.record_edge(tree_node1.node_id, tree_node2.node_id)
+        if self.history is not None:
+            self.history.add_edge(tree_node1.node_id, tree_node2.node_id)
+        self.dot_source.add_edge(tree_node1.node_id, tree_node2.node_id)
 
     def get_output_filename(self):
         if self.gifcount >= 0:
@@ -313,46 +683,118 @@ class Invocation_Tree:
             graph.attr(rankdir="LR")
         return graph
 
-    def build_graph_from_nodes(self):
-        # add nodes and edges to graph
-        graph = self.graph_header()
-        node_items = self.node_id_to_table.items()
-        edges = self.edges
-        if self.horizontal:  # reverse so left to right order is preserved
-            node_items = reversed(node_items)
-            edges.reverse()
-        for nid, table in node_items:
-            graph.node(nid, label=table)
-        for nid1, nid2 in edges:
-            graph.edge(nid1, nid2)
-        return graph
+    def graph_colors(self):
+        return {
+            foreground_color_PH: f'"{self.foreground_color}"',
+            background_color_PH: f'"{self.background_color}"',
+            color_paused_PH: f'"{self.color_paused}"',
+            color_active_PH: f'"{self.color_active}"',
+            color_returned_PH: f'"{self.color_returned}"',
+            }
 
     def recolor_last_graph(self):
-        if not self.uncolored_graph:
-            return self.uncolored_graph
-        graph_str = self.uncolored_graph.source
-
-        def replace_color(token, value):
-            return graph_str.replace(f'{token}', f'"{value}"')
-
-        graph_str = replace_color(foreground_color_PH, self.foreground_color)
-        graph_str = replace_color(background_color_PH, self.background_color)
-        graph_str = replace_color(color_paused_PH, self.color_paused)
-        graph_str = replace_color(color_active_PH, self.color_active)
-        graph_str = replace_color(color_returned_PH, self.color_returned)
-        graph = Source(graph_str)
-        graph.engine = self.uncolored_graph.engine
-        graph.format = self.uncolored_graph.format
-        return graph
+        if len(self.dot_source) == 0:
+            return None
+        header = self.graph_header().source
+        header = header[:header.rindex('}')] # drop closing brace
+        if self.is_viewport():
+            view = self.get_view()
+            return Source(self.dot_source.view_source(header, self.graph_colors(), view,
+                                                      self.placeholder_tables(view), reverse=self.horizontal))
+        return Source(self.dot_source.source(header, self.graph_colors(), reverse=self.horizontal))
+
+    def is_viewport(self):
+        return self.viewport and not self.aggregate
+
+    def get_view(self):
+        """ Returns the viewport.View around the active node, or the last root when the stack
+        is empty, of the first 'node_count' nodes, which are less for an earlier step of a Replay. """
+        store = self.call_store
+        limit = min(self.node_count, len(store))
+        if self.stack:
+            anchor = self.stack[-1].node_id
+        else:
+            anchor = store.last_root
+            while anchor >= limit:
+                anchor = store.prev_sibling[anchor]
+        return viewport.view_around(store, anchor, self.viewport_radius, self.viewport_history, limit)
+
+    def placeholder_tables(self, view):
+        return {dot_id: viewport.placeholder_table(count, foreground_color_PH, background_color_PH)
+                for dot_id, count in view.placeholder_counts.items()}
+
+    def is_folding(self):
+        return self.fold and not self.aggregate and not self.is_viewport()
+
+    def fold_subtree(self, node_id):
+        """ Folds the nodes shown below returned node 'node_id' into it, the nodes below
+        returned before so usually those are just its children that are folded already. """
+        dot_source = self.dot_source
+        start, stop = folding.subtree_edges(dot_source.edges, node_id)
+        if start == stop:
+            return
+        edges = dot_source.cut_edges(start, stop)
+        tables = []
+        for _, child_id in edges:
+            tables.append(dot_source.tables[child_id])
+            dot_source.remove_table(child_id)
+        self.folds[node_id] = folding.Fold(node_id, edges, tables, self.folds)
+
+    def unfold(self, node_id=None):
+        """ Shows the nodes folded into node 'node_id' again, or into any node if None, and
+        renders the tree if it renders. The nodes below keep their own folds. """
+        if node_id is None:
+            for node_id in sorted(self.folds): # parents before their children
+                self.unfold_node(node_id)
+        else:
+            if node_id not in self.folds:
+                raise ValueError(f'node {node_id} is not folded')
+            if self.dot_source.tables[node_id] is None:
+                raise ValueError(f'node {node_id} is folded into another node, unfold that first')
+            self.unfold_node(node_id)
+        if not self.is_graph_outdated:
+            self.graph = self.recolor_last_graph()
+            if self.render and self.graph is not None:
+                self.render_graph(self.graph)
+
+    def unfold_node(self, node_id):
+        dot_source = self.dot_source
+        fold_row = self.fold_row(node_id)
+        fold = self.folds.pop(node_id)
+        for (_, child_id), table in zip(fold.edges, fold.tables):
+            if table is not None:
+                dot_source.set_table(child_id, table)
+        dot_source.insert_edges(folding.first_edge_below(dot_source.edges, node_id), fold.edges)
+        dot_source.set_table(node_id, dot_source.tables[node_id].replace(fold_row, ''))
 
     def create_graph(self):
+        self.update_tables()
+        self.is_graph_outdated = False
+        return self.recolor_last_graph()
+
+    def update_tables(self):
+        """ Updates the tables of the nodes that changed since the last graph. """
+        returned = set(self.returned)
+        if self.aggregate: # a merged node that returned can be called again
+            returned.difference_update(self.stack)
+        # update nodes paused by a call since the last graph
+        paused = [node for node in dict.fromkeys(self.paused) if not node in returned]
+        for node in paused:
+            self.update_node(node, active=False)
         # update returned nodes
         for node in self.prev_returned:
-            self.update_node(node, use_old_content=True)
+            if self.dot_source.tables[node.node_id] is not None: # not folded since
+                self.update_node(node, use_old_content=True)
         self.prev_returned = []
-        for node in self.returned:
-            self.update_node(node, returned=True)
-            self.prev_returned.append(node)
+        is_folding = self.is_folding()
+        for node in dict.fromkeys(self.returned):
+            if node in returned:
+                if is_folding:
+                    self.fold_subtree(node.node_id)
+                self.update_node(node, returned=True)
+                if node.aggregate is None: # a merged node keeps its frame to show its next call
+                    node.freeze() # release its frame
+                self.prev_returned.append(node)
         self.returned = []
         # update active node
         active_node = None 
@@ -361,21 +803,76 @@ class Invocation_Tree:
             self.update_node(active_node, active=True)
         # update paused nodes
         for node in self.prev_paused:
-            if node is not active_node: # don't overwrite active node
+            if node is not active_node and not node in returned: # don't overwrite active or returned node
                 self.update_node(node, active=False, use_old_content=True)
-        self.prev_paused = self.paused.copy()
+        self.prev_paused = paused
         self.paused = []
-        self.uncolored_graph = self.build_graph_from_nodes()
-        graph = self.recolor_last_graph()
-        return graph
         
     def render_graph(self, graph):
         view = (self.filename!=self.prev_filename) and self.show
-        graph.render(outfile=self.get_output_filename(), view=view, cleanup=self.cleanup, quiet=self.quiet)
+        if self.renderer == 'svg':
+            self.render_svg(view)
+        elif self.renderer == 'graphviz':
+            graph.render(outfile=self.get_output_filename(), view=view, cleanup=self.cleanup, quiet=self.quiet)
+        elif self.renderer == 'jupyter':
+            self.get_notebook_display().show(self.svg_source())
+        else:
+            raise ValueError(f"unknown renderer {self.renderer!r}, use one of: graphviz, svg, jupyter")
         self.prev_filename = self.filename
 
+    def render_svg(self, view):
+        """ Writes the tree to an SVG file with the native tidy tree renderer, without running graphviz. """
+        filename = os.path.splitext(self.get_output_filename())[0] + '.svg'
+        with open(filename, 'w', encoding='utf-8') as file:
+            file.write(self.svg_source())
+        if view:
+            graphviz.view(filename, quiet=self.quiet)
+
+    def svg_source(self):
+        """ Returns the tree as SVG, laid out by the native tidy tree renderer. """
+        if self.is_viewport():
+            tables, edges = self.view_tables()
+        else:
+            tables, edges = self.dot_source.colored_tables(self.graph_colors()), self.dot_source.edges
+        return svg_render.tree_to_svg(tables,
+                                      edges,
+                                      self.foreground_color,
+                                      self.background_color,
+                                      self.fontname,
+                                      self.fontsize,
+                                      self.horizontal)
+
+    def get_notebook_display(self):
+        if self.notebook_display is None:
+            self.notebook_display = notebook.Notebook_Display(self.frame_rate)
+        self.notebook_display.frame_rate = self.frame_rate
+        return self.notebook_display
+
+    def view_tables(self):
+        """ Returns the colored tables and the edges, by index in the tables, of the viewport. """
+        view = self.get_view()
+        colors = self.graph_colors()
+        placeholder_tables = self.placeholder_tables(view)
+        tables = []
+        indices = {}
+        for dot_id, node_id in view.nodes:
+            table = placeholder_tables[dot_id] if node_id is None else self.dot_source.tables[node_id]
+            if table is not None:
+                indices[dot_id] = len(tables)
+                tables.append(self.dot_source.recolor(table, colors))
+        edges = [(indices[id1], indices[id2]) for id1, id2 in view.edges if id1 in indices and id2 in indices]
+        return tables, edges
+
     def output_graph(self, frame, event):
-        if self.block or self.gifcount >= 0:
+        if self.history is not None:
+            self.record_history(frame, event)
+        if self.recorder is not None:
+            self.recorder.record_step(self, frame, event)
+        elif self.block and not self.is_stop(frame, event): # wait for a stop to create the graph
+            self.has_skipped_steps = True
+            self.defer_graph()
+        elif self.block or self.gifcount >= 0:
+            self.has_skipped_steps = False
             self.is_highlighted = False
             self.graph = self.create_graph()
             if self.is_highlighted:
@@ -386,13 +883,246 @@ class Invocation_Tree:
                         filename = frame.f_code.co_filename
                         line_nr = frame.f_lineno
                         print(f'{event.capitalize()} at {filename}:{line_nr}', end='. ')
-                    input('Press <Enter> to continue...')
-        else:
+                    self.wait_for_enter()
+        elif self.render and self.renderer == 'jupyter' and not self.get_notebook_display().is_due():
+            self.defer_graph() # throttled, a later frame shows the changes
+        elif self.render:
             self.graph = self.create_graph()
-            if self.render:
-                self.render_graph(self.graph)
+            self.render_graph(self.graph)
+        elif not self.keep_tree: # the spans are the output
+            self.paused = []
+            self.returned = []
+        else: # nothing is shown, so defer creating the graph to get_graph()
+            self.defer_graph()
+
+    def defer_graph(self):
+        self.graph = None
+        self.is_graph_outdated = True
+        if len(self.returned) > self.max_deferred_returns: # release their frames
+            self.graph = self.create_graph()
+
+    def is_stop(self, frame, event):
+        """ Returns True if blocking mode stops at 'event' in 'frame', so at each step if
+        there are no breakpoints and no prompt command runs on. Each breakpoint counts its hits. """
+        if self.fast_forward is not None:
+            node = self.returned[-1] if event == 'return' else self.stack[-1]
+            if not self.fast_forward.is_stop(self.code_infos.get(frame).class_fun_name, node, event):
+                return False
+            self.fast_forward = None
+            return True
+        if not self.breakpoints:
+            return True
+        class_fun_name = self.code_infos.get(frame).class_fun_name
+        depth = len(self.stack) + (event == 'return')
+        stops = [breakpoint.is_stop(class_fun_name, frame, depth) for breakpoint in self.breakpoints]
+        return any(stops)
+
+    def add_breakpoint(self, function=None, condition=None, depth=None, every=1):
+        """ Adds a breakpoints.Breakpoint and returns it, then blocking mode stops only at
+        the breakpoints, the steps in between are not rendered. """
+        breakpoint = breakpoints.Breakpoint(function, condition, depth, every)
+        self.breakpoints.append(breakpoint)
+        return breakpoint
+
+    def record_history(self, frame, event):
+        """ Adds a step to the history with the nodes changed by 'event'. """
+        updates = []
+        if event == 'call' and len(self.stack) > 1:
+            updates.append((self.stack[-2], event_log.PAUSED))
+        elif event == 'return' and self.returned:
+            updates.append((self.returned[-1], event_log.RETURNED))
+        if self.stack:
+            updates.append((self.stack[-1], event_log.ACTIVE))
+        self.history.add_step(event, frame.f_code.co_filename, frame.f_lineno,
+                              [(node.node_id, state, self.capture_node(node, state == event_log.RETURNED))
+                               for node, state in updates if node.frame is not None])
+
+    def capture_node(self, tree_node, is_returned):
+        """ Returns (plan, values, return_value) of 'tree_node' captured by the Snapshot_Store
+        of the history, the values per row of render plan 'plan', 'missing' if not shown. """
+        info = self.code_infos.get(tree_node.frame)
+        local_vars = tree_node.frame.f_locals
+        plan = self.get_render_plan(info, local_vars)
+        capture = self.history.store.capture
+        values = tuple([capture(local_vars[row[0]]) if filter_value(local_vars[row[0]]) else missing
+                        for row in plan.rows])
+        return_value = missing
+        if is_returned and plan.show_return:
+            return_value = capture(tree_node.return_value)
+        return plan, values, return_value
+
+    def captured_contents(self, capture, memo):
+        """ Returns the contents of a node captured by capture_node(), as node_contents() does
+        for a live node, 'memo' is passed to snapshots.thaw(). """
+        plan, values, return_value = capture
+        rows = [(var_content, self.value_to_string(val_name, snapshots.thaw(value, memo), True, key_converter))
+                for (var, var_name, val_name, var_content, key_converter), value in zip(plan.rows, values)
+                if value is not missing]
+        return_content = None
+        if return_value is not missing:
+            return_content = self.value_to_string(plan.return_name, snapshots.thaw(return_value, memo),
+                                                  True, plan.return_converter)
+        return plan.name_content, rows, return_content
+
+    def wait_for_enter(self):
+        """ Waits for <Enter> or a command to run on to a later step, see breakpoints.prompt_help. """
+        while True:
+            command = input('Press <Enter> to continue (h for help)...')
+            if command.strip().lower() in ('h', '?'):
+                print(breakpoints.prompt_help)
+                continue
+            try:
+                self.fast_forward = breakpoints.parse_command(command, self.stack[-1] if self.stack else None)
+                return
+            except ValueError as e:
+                print(f'{e}, h for help')
+
+    def collect_stats(self, print_at_exit=False):
+        """ Starts counting the events and timing the phases of this tree, see stats(). """
+        if self.phase_stats is None:
+            self.phase_stats = phase_stats.Phase_Stats(self)
+        if print_at_exit:
+            atexit.register(self.print_stats)
+
+    def profile(self, overhead=None):
+        """ Starts timing each call, its wall and CPU time inclusive and exclusive of its
+        children are shown in its node when it returns, colored by heat. The time the tree
+        takes to handle an event is left out, plus 'overhead' (wall, cpu) seconds per event
+        for the part of tracing that can't be measured, which is calibrated if None. """
+        if self.profiler is None:
+            if overhead is None:
+                overhead = profiling.calibrate(Invocation_Tree, monitoring.select_backend(self.backend))
+            self.profiler = profiling.Profiler(overhead)
+            self.trace = self.profiler.wrap(self.trace)
+
+    def check_call_store(self):
+        """ Raises a ValueError if the tree has nodes that are not in the call store, so an
+        export would leave them out. """
+        if len(self.call_store) < self.node_count:
+            raise ValueError(f'the call store has {len(self.call_store)} of {self.node_count} nodes, '
+                             'nothing is kept of a tree that only streams spans')
+
+    def export_collapsed(self, filename, weight='calls'):
+        """ Writes the calls traced so far as collapsed stacks, the input of flamegraph.pl
+        and most flame graph viewers, weighted by 'calls' or self 'time' (of profile()).
+        Only the calls the tree shows are included, it is written without creating a graph. """
+        self.check_call_store()
+        with open(filename, 'w', encoding='utf-8') as file:
+            flame_graph.write_collapsed(self.call_store, file, weight)
+
+    def export_speedscope(self, filename, weight='calls'):
+        """ Writes the calls traced so far as a speedscope profile, see export_collapsed(). """
+        self.check_call_store()
+        with open(filename, 'w', encoding='utf-8') as file:
+            flame_graph.write_speedscope(self.call_store, file, weight, os.path.basename(filename),
+                                         f'invocation_tree {__version__}')
+
+    def stream_spans(self, filename, format=None):
+        """ Starts writing each call as a begin and an end span to 'filename' while it runs,
+        in 'jsonl' or 'chrome' trace event format, by default 'jsonl' for a '.jsonl'
+        filename and 'chrome' otherwise. """
+        if self.span_writer is not None:
+            self.span_writer.close()
+        self.span_writer = span_export.Span_Writer(filename, format)
+
+    def keep_history(self):
+        """ Starts keeping the history of each step, with copies of the containers in the
+        variables that share what didn't change between steps, see render_step(). """
+        if self.history is None:
+            self.history = snapshots.History()
+
+    def render_step(self, index, filename='step.pdf'):
+        """ Renders the tree as it was at step 'index' of the history (negative counts from
+        the end) with the changes of that step highlighted, and returns its Invocation_Tree.
+        Just the values of that step are converted to string. """
+        history = self.history
+        if history is None:
+            raise ValueError('no history is kept, call keep_history() before tracing')
+        if index < 0:
+            index += len(history)
+        if not 0 <= index < len(history):
+            raise IndexError(f'step {index} out of range, the history has {len(history)} steps')
+        tree = Invocation_Tree(filename=filename, render=False, show=self.show, block=False, renderer=self.renderer)
+        tree.dark_mode(self.in_dark_mode)
+        tree.transparent_background(self.in_transparent_background)
+        tree.layout(self.horizontal)
+        memo = {}
+        nodes = {}
+
+        def step(i, edges, states):
+            updates = [(node_id, state, self.captured_contents(capture, memo))
+                       for node_id, (state, capture) in states.items()]
+            return event_log.Step(i, *history.locations[i], edges, updates)
+
+        if index > 0: # the state before, to highlight the changes of the step
+            tree.replay_step(step(index - 1, *history.state_at(index - 1)), nodes)
+            tree.update_tables()
+        tree.replay_step(step(index, history.step_edges[index],
+                              {node_id: (state, capture) for node_id, state, capture in history.step_updates[index]}),
+                         nodes)
+        tree.graph = tree.create_graph()
+        if tree.graph is not None:
+            tree.render_graph(tree.graph)
+        return tree
+
+    def stats(self):
+        """ Returns the events received and dropped by filters, and the calls and cumulative
+        seconds per phase since collect_stats(), or None if stats are not collected. """
+        if self.phase_stats is None:
+            return None
+        return self.phase_stats.as_dict()
+
+    def print_stats(self):
+        if self.phase_stats is not None:
+            print(self.phase_stats)
+
+    def replay(self, filename):
+        """ Feeds the steps recorded in log 'filename' to this tree as if it traced the recorded
+        run, so it produces its usual output (blocking, gif frames, ...). """
+        nodes = {}
+        for step in event_log.read_steps(filename):
+            self.replay_step(step, nodes)
+            self.output_graph(event_log.Recorded_Frame(step.filename, step.line_nr), step.event)
+
+    def replay_step(self, step, nodes):
+        """ Applies recorded 'step' to the tree as trace() would, 'nodes' maps node_id to the
+        Tree_Nodes replayed so far. """
+        for parent_id, child_id in step.edges:
+            for node_id in (parent_id, child_id):
+                if node_id not in nodes:
+                    nodes[node_id] = Tree_Node(node_id, None, None)
+            self.add_edge(nodes[parent_id], nodes[child_id])
+        self.stack = []
+        for node_id, state, contents in step.updates:
+            node = nodes.get(node_id)
+            if node is None:
+                node = nodes[node_id] = Tree_Node(node_id, None, None)
+            node.contents = contents
+            if state == event_log.PAUSED:
+                self.paused.append(node)
+            elif state == event_log.RETURNED:
+                self.returned.append(node)
+            else:
+                self.stack.append(node)
+        self.node_count = len(nodes)
+        self.replay_call_store(step)
+
+    def replay_call_store(self, step):
+        """ Adds the nodes of recorded 'step' to the call store as trace() does, for viewport
+        mode and the exports. """
+        store = self.call_store
+        parents = {child_id: parent_id for parent_id, child_id in step.edges}
+        names = {node_id: contents[0] for node_id, state, contents in step.updates}
+        for node_id in sorted(parents.keys() | names.keys()):
+            if node_id == len(store):
+                store.add(parents.get(node_id), html.unescape(names.get(node_id, '')))
+        for node_id, state, contents in step.updates:
+            if state == event_log.RETURNED and node_id < len(store):
+                store.set_returned(node_id)
 
     def get_graph(self):
+        if self.graph is None and self.is_graph_outdated:
+            self.graph = self.create_graph()
         return self.graph
 
     def is_external(self, frame):
@@ -403,54 +1133,152 @@ class Invocation_Tree:
             'site-packages' in filename or   # Cross-platform: works on Windows, Mac, Linux
             'lib/python' in filename or      # Linux/Mac standard library
             'lib\\python' in filename or     # Windows standard library (backslashes)
-            'Python.framework' in filename): # Mac framework Python
+            'Python.framework' in filename or # Mac framework Python
+            filename.startswith(package_dir)): # invocation_tree itself
             return True
         return False
 
-    def trace(self, frame, event, arg):
+    def classify(self, frame):
+        """ Returns the Code_Info of the code of 'frame', cached in 'self.code_infos'. """
         if self.is_external(frame):
-            return
+            return code_info.Code_Info(True)
         class_fun_name = get_class_function_name(frame)
-        if event == 'return':
-            if class_fun_name == self.ignoring_call:
-                self.ignoring_call = None
-                return
-        if self.ignoring_call is not None:
-            return
+        return code_info.Code_Info(False, class_fun_name,
+                                   self.regset_hide_calls.match(class_fun_name, self.hide_calls),
+                                   self.regset_ignore_calls.match(class_fun_name, self.ignore_calls))
+
+    def update_filters(self):
+        """ Recompiles the filters that changed, and then drops the cached Code_Info verdicts
+        and render plans. Changes in 'to_string' also drop the cached converters. """
+        changed = self.regset_hide_vars.update_pattern(self.hide_vars)
+        changed |= self.regset_hide_calls.update_pattern(self.hide_calls)
+        changed |= self.regset_ignore_calls.update_pattern(self.ignore_calls)
+        if self.to_string_tracker.changed(self.to_string):
+            self.type_converters.clear()
+            self.has_id_converters = any(type(key) is int for key in self.to_string)
+            changed = True
+        if changed:
+            self.code_infos.clear()
+            self.highlights.clear()
+            if self.monitor is not None:
+                self.monitor.restart()
+
+    def trace(self, frame, event, arg):
+        """ Updates the tree for 'event' in 'frame'. Returns False if the other events of the
+        frame are of no interest, as for external and hidden calls and the children of an
+        ignored call. The call of an ignored frame sets 'self.ignoring_frame' and returns True
+        as its 'return' event is needed to end the ignoring. """
+        self.update_filters()
+        info = self.code_infos.get(frame)
+        if info.is_external:
+            return False
+        if self.ignoring_frame is not None:
+            if event == 'return' and frame is self.ignoring_frame:
+                self.ignoring_frame = None
+            return False
+        if event == 'call' and info.is_ignored:
+            self.ignoring_frame = frame
+            return True
+        if info.is_hidden:
+            return False
         if event == 'call':
-            if self.regset_ignore_calls.match(class_fun_name, self.ignore_calls):
-                self.ignoring_call = class_fun_name
-                return
-        if not self.regset_hide_calls.match(class_fun_name, self.hide_calls):
-            if event == 'call':
-                # update previous active node with its current frame now
-                if len(self.stack)>0:
-                    previous = self.stack[-1]
-                    self.update_node(previous, active=False)
-                    self.paused.append(previous)
-                # create new node
-                self.stack.append(Tree_Node(frame, None))
-                if len(self.stack)>1:
+            # previous active node is paused, it gets rendered with its current frame in create_graph()
+            if len(self.stack)>0:
+                self.paused.append(self.stack[-1])
+            if self.aggregate:
+                self.stack.append(self.merged_node(frame, info.class_fun_name))
+            else: # create new node
+                if self.keep_tree:
+                    self.call_store.add(self.stack[-1].node_id if self.stack else None, info.class_fun_name)
+                self.stack.append(Tree_Node(self.node_count, frame, None))
+                self.node_count += 1
+                if len(self.stack)>1 and self.keep_tree:
                     self.add_edge(self.stack[-2], self.stack[-1])
-                    self.paused.append(self.stack[-2])
-                self.output_graph(frame, event)
-            elif event == 'return':
-                self.stack[-1].return_value = arg
-                self.returned.append(self.stack.pop())
-                self.output_graph(frame, event)
-            elif event == 'line' and self.each_line:
-                self.output_graph(frame, event)
+            if self.profiler is not None:
+                self.profiler.start(self.stack[-1])
+            if self.span_writer is not None:
+                self.write_span(self.stack[-1], self.stack[-2] if len(self.stack)>1 else None, False)
+            self.output_graph(frame, event)
+        elif event == 'return':
+            node = self.stack.pop()
+            node.return_value = arg
+            self.returned.append(node)
+            if self.profiler is not None:
+                self.profiler.stop(node, self.stack[-1] if self.stack else None)
+                if node.timing is not None and self.keep_tree:
+                    self.call_store.add_time(node.node_id, node.timing.self_wall())
+            if node.aggregate is not None:
+                node.aggregate.ret(self.clock())
+            elif self.keep_tree:
+                self.call_store.set_returned(node.node_id)
+            if self.span_writer is not None:
+                self.write_span(node, self.stack[-1] if self.stack else None, True)
+            self.output_graph(frame, event)
+        elif event == 'line' and self.each_line:
+            self.output_graph(frame, event)
+        return True
+
+    def clock(self):
+        return time.perf_counter() if self.profiler is None else self.profiler.event_wall
+
+    def merged_node(self, frame, class_fun_name):
+        """ Returns the node of the call in 'frame' when aggregating, all calls of the same
+        function by the same node are merged into one node, so the tree has a node per call
+        path instead of per call. """
+        parent = self.stack[-1] if self.stack else None
+        key = (None if parent is None else parent.node_id, class_fun_name)
+        node = self.merged_nodes.get(key)
+        if node is None:
+            self.call_store.add(None if parent is None else parent.node_id, class_fun_name)
+            node = self.merged_nodes[key] = Tree_Node(self.node_count, frame, None)
+            node.aggregate = aggregation.Call_Aggregate()
+            self.node_count += 1
+            if parent is not None:
+                self.add_edge(parent, node)
+        else: # show this call
+            self.call_store.add_call(node.node_id)
+            node.frame = frame
+            node.return_value = None
+            node.is_returned = False
+        node.aggregate.call(self.clock())
+        slot = node.aggregate.sample_slot()
+        if slot is not None:
+            arguments = self.arguments_content(frame, class_fun_name)
+            if arguments is not None:
+                node.aggregate.add_sample(slot, arguments)
+        return node
+
+    def arguments_content(self, frame, class_fun_name):
+        """ Returns the arguments of the call in 'frame' as '(name=value, ...)' without the
+        hidden ones, or None if it shows no arguments. """
+        local_vars = frame.f_locals
+        contents = []
+        for var in aggregation.argument_names(frame.f_code):
+            val_name = class_fun_name+'.'+var
+            if (var in local_vars and filter_variables(var, local_vars[var]) and
+                not self.regset_hide_vars.match(val_name, self.hide_vars)):
+                contents.append(var + '=' + self.value_to_string(val_name, local_vars[var], True))
+        if not contents:
+            return None
+        return '(' + ', '.join(contents) + ')'
 
     def global_tracer(self, frame, event, arg):
         """ Global trace function that chains to any previous global tracer so it works in a debugger too. """
-        self.trace(frame, event, arg) # update graph
+        is_traced = self.trace(frame, event, arg) # update graph
         # call previous global tracer if any existed
         prev_local_tracer = self.prev_global_tracer(frame, event, arg) if self.prev_global_tracer else None
+        is_ignored = frame is self.ignoring_frame
+        if is_ignored:
+            sys.settrace(self.ignoring_tracer) # run the children of an ignored call untraced
+        elif not is_traced and prev_local_tracer is None:
+            return None # no local tracer needed for external or hidden calls
 
         def local_tracer(frame, event, arg):
             """ Global trace is for a 'call' event that signals a new frame, it returns a local tracer to 
             handle other events in that frame. """
             self.trace(frame, event, arg)
+            if is_ignored and event == 'return':
+                sys.settrace(self.global_tracer) # ignored call returned, resume tracing
 
         def local_multiplexer(frame, event, arg):
             """ Multiplexes between the local tracer and any previous local tracer so it works in a debugger too. """
@@ -464,12 +1292,18 @@ class Invocation_Tree:
             return local_multiplexer
 
         # Optimize: disable line tracing if not needed
-        if not self.each_line:
+        if not self.each_line or is_ignored:
             frame.f_trace_lines = False
             frame.f_trace_opcodes = False
 
         return local_multiplexer
 
+    def ignoring_tracer(self, frame, event, arg):
+        """ Global trace function while inside an ignored call, it only chains to any previous global tracer. """
+        if self.prev_global_tracer:
+            return self.prev_global_tracer(frame, event, arg)
+        return None
+
 def blocking(filename='tree.pdf'):
     return Invocation_Tree(filename=filename)
 
@@ -491,6 +1325,34 @@ def gif_each_change(filename='tree.png'):
 def non_blocking(filename='tree.pdf'):
     return Invocation_Tree(filename=filename, block=False)
 
+def recording(filename='tree.ivtlog', each_line=False):
+    """ Renders nothing while running, just records the steps to log 'filename' for replay(). """
+    tree = Invocation_Tree(filename=filename, render=False, show=False, block=False, each_line=each_line)
+    tree.recorder = event_log.Recorder(filename)
+    return tree
+
+def streaming(filename='tree.jsonl', format=None):
+    """ Renders nothing, just streams each call as a begin and an end span to 'filename', see stream_spans(). """
+    tree = Invocation_Tree(filename=filename, render=False, show=False, block=False)
+    tree.keep_tree = False
+    tree.stream_spans(filename, format)
+    return tree
+
+def notebook_inline(block=False):
+    """ Shows the tree inline in a Jupyter notebook, in one output area that is updated in place. """
+    return Invocation_Tree(show=False, block=block, renderer='jupyter')
+
+def replay_recording(log_filename, filename='tree.pdf'):
+    """ Returns a Replay of a recording to seek() to any step, which renders just that step. """
+    return time_travel.Replay(log_filename, Invocation_Tree(filename=filename, block=False))
+
+def render_recording(log_filename, filename='tree.pdf', show=True):
+    """ Renders the final tree of a recording. """
+    tree = Invocation_Tree(filename=filename, render=False, show=show, block=False)
+    tree.replay(log_filename)
+    tree.render_graph(tree.get_graph())
+    return tree
+
 
 # ------ decorator ------
 
@@ -505,6 +1367,8 @@ def show(fun):
         global decorator_tree
         if decorator_tree is None:
             return fun(*args, **kwargs)
+        if monitoring.select_backend(decorator_tree.backend) == 'monitoring':
+            return monitoring.call_monitored(decorator_tree, fun, args, kwargs, decorator_tree.each_line)
         prev_tracer = sys.gettrace()
         active_depth = 0  # handles recursion of fun
 
@@ -559,6 +1423,8 @@ def decorate_profile(fun):
         global decorator_tree
         if decorator_tree is None:
             return fun(*args, **kwargs)
+        if monitoring.select_backend(decorator_tree.backend) == 'monitoring':
+            return monitoring.call_monitored(decorator_tree, fun, args, kwargs, False)
         prev_profiler = sys.getprofile()
         active_depth = 0  # handles recursion of fun
         
@@ -0,0 +1,61 @@
+import inspect
+import random
+
+import invocation_tree.profiling as profiling
+
+sample_size = 3 # calls whose arguments a merged node keeps: the first and a reservoir sample of the others
+sampler = random.Random(0) # seeded, so a run shows the same sample each time
+
+class Call_Aggregate:
+    """ The calls merged into one node: the number of calls, the total time of the calls
+    that returned, and the arguments of a bounded sample of the calls. The node shows the
+    variables of the last call. """
+    __slots__ = ('calls', 'returns', 'total', 'start', 'samples')
+
+    def __init__(self):
+        self.calls = 0
+        self.returns = 0
+        self.total = 0.0
+        self.start = 0.0
+        self.samples = [] # (call number, arguments content), the first call and then the reservoir
+
+    def call(self, clock):
+        self.calls += 1
+        self.start = clock
+
+    def ret(self, clock):
+        self.returns += 1
+        self.total += max(0.0, clock - self.start)
+
+    def sample_slot(self):
+        """ Returns the index in 'samples' for the arguments of the current call, or None if
+        it is not sampled. Index 0 holds the first call, the others a reservoir sample of
+        the later calls, in which each later call is equally likely to be. """
+        if len(self.samples) < sample_size:
+            return len(self.samples)
+        i = sampler.randrange(self.calls - 1)
+        return i + 1 if i < sample_size - 1 else None
+
+    def add_sample(self, slot, arguments):
+        if slot == len(self.samples):
+            self.samples.append((self.calls, arguments))
+        else:
+            self.samples[slot] = (self.calls, arguments)
+
+def argument_names(code):
+    """ Returns the names of the arguments of 'code', including *args and **kwargs. """
+    count = code.co_argcount + code.co_kwonlyargcount
+    count += bool(code.co_flags & inspect.CO_VARARGS) + bool(code.co_flags & inspect.CO_VARKEYWORDS)
+    return code.co_varnames[:count]
+
+def aggregate_content(aggregate):
+    """ Returns the content of the row with the call count and times of a merged node. """
+    content = f'calls {aggregate.calls}'
+    if aggregate.returns > 0:
+        content += (f', total {profiling.format_seconds(aggregate.total)}'
+                    f', mean {profiling.format_seconds(aggregate.total / aggregate.returns)}')
+    return content
+
+def samples_content(aggregate):
+    """ Returns the content of the row with the sampled arguments of a merged node, in call order. """
+    return 'sample args ' + ' '.join(arguments for _, arguments in sorted(aggregate.samples))
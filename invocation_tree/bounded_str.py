@@ -0,0 +1,96 @@
+def budgeted(to_string):
+    """ Marks a to_string function as taking a second 'budget' argument. It may then return
+    just a suffix of its full string, as long as that suffix is longer than 'budget', see tail_str(). """
+    to_string.takes_budget = True
+    return to_string
+
+def tail_str(value, budget):
+    """ Returns str(value), or a suffix of it longer than 'budget' if it is longer than that.
+    Built-in containers are converted from their end and only as far as needed, so the cost
+    depends on 'budget' and not on the size of 'value'. """
+    value_type = type(value)
+    if value_type is str:
+        return value[-budget-1:]
+    if value_type in container_types:
+        return tail_repr(value, budget + 1, set())
+    return str(value)
+
+def tail_repr_str(value, budget):
+    if len(value) <= budget:
+        return repr(value)
+    quote = '"' if "'" in value and '"' not in value else "'"
+    tail = value[-budget:]
+    tail_quote = '"' if "'" in tail and '"' not in tail else "'"
+    if tail_quote != quote: # escaping would differ
+        return repr(value)
+    return repr(tail)[1:]
+
+def tail_repr(value, budget, active_ids):
+    """ Returns repr(value), or a suffix of it of at least 'budget' characters. """
+    value_type = type(value)
+    if value_type is str:
+        return tail_repr_str(value, budget)
+    if not value_type in container_types:
+        return repr(value)
+    open_str, close_str, recursive_str = container_types[value_type]
+    if len(value) == 0:
+        return empty_strs[value_type]
+    value_id = id(value)
+    if value_id in active_ids:
+        return recursive_str
+    active_ids.add(value_id)
+    if value_type is tuple and len(value) == 1:
+        close_str = ',' + close_str
+    pieces = [close_str]
+    length = len(close_str)
+    sep = ''
+    if value_type is dict:
+        for key, val in reversed(value.items()):
+            if length >= budget:
+                break
+            pieces.append(sep)
+            piece = tail_repr(val, budget - length, active_ids)
+            pieces.append(piece)
+            length += len(sep) + len(piece)
+            if length >= budget:
+                break
+            pieces.append(': ')
+            piece = tail_repr(key, budget - length, active_ids)
+            pieces.append(piece)
+            length += 2 + len(piece)
+            sep = ', '
+        else:
+            if length < budget: # else the last piece may be partial
+                pieces.append(open_str)
+    else:
+        items = reversed(value) if value_type in (list, tuple) else reversed(list(value))
+        for item in items:
+            if length >= budget:
+                break
+            pieces.append(sep)
+            piece = tail_repr(item, budget - length, active_ids)
+            pieces.append(piece)
+            length += len(sep) + len(piece)
+            sep = ', '
+        else:
+            if length < budget:
+                pieces.append(open_str)
+    active_ids.discard(value_id)
+    pieces.reverse()
+    return ''.join(pieces)
+
+container_types = { # type: (open, close, recursive)
+    list: ('[', ']', '[...]'),
+    tuple: ('(', ')', '(...)'),
+    dict: ('{', '}', '{...}'),
+    set: ('{', '}', '{...}'),
+    frozenset: ('frozenset({', '})', 'frozenset(...)'),
+}
+
+empty_strs = {
+    list: '[]',
+    tuple: '()',
+    dict: '{}',
+    set: 'set()',
+    frozenset: 'frozenset()',
+}
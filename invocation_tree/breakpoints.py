@@ -0,0 +1,88 @@
+import invocation_tree.regex_set as regset
+
+class Breakpoint:
+    """ A condition to stop at in blocking mode. A step is a hit if its function name matches
+    'function' (a name, a 're:' regular expression, or a set of these), its depth is
+    'depth' (1 for a root call), and 'condition(locals)' is true for the locals of its
+    frame, None matches any. It stops on every 'every'th hit. """
+
+    def __init__(self, function=None, condition=None, depth=None, every=1):
+        if every < 1:
+            raise ValueError(f'every should be at least 1, not {every!r}')
+        self.function = function
+        self.functions = None
+        if function is not None:
+            self.functions = {function} if isinstance(function, str) else set(function)
+        self.regset_functions = regset.Regex_Set(self.functions)
+        self.condition = condition
+        self.depth = depth
+        self.every = every
+        self.hits = 0
+
+    def __repr__(self):
+        return (f'Breakpoint(function={self.function!r}, condition={self.condition!r}, '
+                f'depth={self.depth!r}, every={self.every}, hits={self.hits})')
+
+    def is_stop(self, class_fun_name, frame, depth):
+        """ Counts the hit if the step is one, returns True if it stops there. """
+        if self.depth is not None and depth != self.depth:
+            return False
+        if self.functions is not None and not self.regset_functions.match(class_fun_name, self.functions):
+            return False
+        if self.condition is not None:
+            try:
+                if not self.condition(frame.f_locals):
+                    return False
+            except Exception:
+                return False
+        self.hits += 1
+        return self.hits % self.every == 0
+
+
+prompt_help = '''Commands:
+  <Enter>      next step
+  s N          skip N steps
+  r            run until the active call returns
+  c NAME       continue to the next call of function NAME (or 're:' regular expression)
+  e            run to the end and render once
+  h            this help'''
+
+class Fast_Forward:
+    """ A prompt command that runs on without rendering until it stops: after skipping
+    'steps' steps, at the return of 'node', or at the call of a function matching
+    'function', and with none of these at the end of the run. """
+
+    def __init__(self, steps=None, node=None, function=None):
+        self.steps = steps
+        self.node = node
+        self.functions = None if function is None else {function}
+        self.regset_functions = regset.Regex_Set(self.functions)
+
+    def is_stop(self, class_fun_name, node, event):
+        if self.steps is not None:
+            self.steps -= 1
+            return self.steps < 0
+        if self.node is not None:
+            return event == 'return' and node is self.node
+        if self.functions is not None:
+            return event == 'call' and self.regset_functions.match(class_fun_name, self.functions)
+        return False
+
+def parse_command(command, active_node):
+    """ Returns the Fast_Forward of prompt 'command' (see 'prompt_help'), or None for the
+    next step. Raises a ValueError with the reason if it is not a valid command. """
+    words = command.split()
+    if len(words) == 0:
+        return None
+    name, args = words[0].lower(), words[1:]
+    if name == 's' and len(args) == 1 and args[0].isdigit():
+        return Fast_Forward(steps=int(args[0]))
+    if name == 'r' and not args:
+        if active_node is None:
+            raise ValueError('there is no active call')
+        return Fast_Forward(node=active_node)
+    if name == 'c' and len(args) == 1:
+        return Fast_Forward(function=args[0])
+    if name == 'e' and not args:
+        return Fast_Forward()
+    raise ValueError(f'unknown command {command!r}')
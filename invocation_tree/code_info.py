@@ -0,0 +1,70 @@
+missing = object()
+
+def get_self_class(frame):
+    self_value = frame.f_locals.get('self', missing)
+    return None if self_value is missing else self_value.__class__
+
+class Code_Info:
+    """ What the tree needs to know about a code object, so it is computed just once. """
+    __slots__ = ('is_external', 'class_fun_name', 'is_hidden', 'is_ignored', 'plans')
+
+    def __init__(self, is_external, class_fun_name='', is_hidden=False, is_ignored=False):
+        self.is_external = is_external
+        self.class_fun_name = class_fun_name
+        self.is_hidden = is_hidden
+        self.is_ignored = is_ignored
+        self.plans = {} # tuple of variable names -> Render_Plan
+
+    def __repr__(self):
+        return (f'Code_Info(is_external={self.is_external}, class_fun_name={self.class_fun_name!r}, '
+                f'is_hidden={self.is_hidden}, is_ignored={self.is_ignored})')
+
+
+class Render_Plan:
+    """ How Invocation_Tree.build_html_table() renders a frame with a given set of variable
+    names, so that per update only the values need converting to string. """
+    __slots__ = ('name_content', 'rows', 'return_name', 'return_converter', 'show_return')
+
+    def __init__(self, name_content, rows, return_name, return_converter, show_return):
+        self.name_content = name_content
+        self.rows = rows # list of (var, var_name, val_name, var_content, key_converter)
+        self.return_name = return_name
+        self.return_converter = return_converter
+        self.show_return = show_return
+
+
+class Code_Info_Cache:
+    """ Maps a frame's code object to its Code_Info, created by 'classify(frame)' on first use.
+    The name of code with a 'self' variable depends on the class of 'self', so for such code
+    there is a Code_Info per class. Call clear() when the classification changes. """
+
+    def __init__(self, classify):
+        self.classify = classify
+        self.infos = {} # code -> Code_Info, or for code with 'self': code -> {class -> Code_Info}
+
+    def clear(self):
+        self.infos.clear()
+
+    def depends_on_class(self, code):
+        return self.infos.get(code).__class__ is dict
+
+    def get(self, frame):
+        info = self.infos.get(frame.f_code)
+        if info is None:
+            info = self.add(frame)
+        if info.__class__ is dict:
+            self_class = get_self_class(frame)
+            class_info = info.get(self_class)
+            if class_info is None:
+                class_info = info[self_class] = self.classify(frame)
+            return class_info
+        return info
+
+    def add(self, frame):
+        code = frame.f_code
+        info = self.classify(frame)
+        if not info.is_external and 'self' in code.co_varnames:
+            self.infos[code] = {get_self_class(frame): info}
+        else:
+            self.infos[code] = info
+        return info
@@ -0,0 +1,103 @@
+import re
+
+class Dot_Source:
+    """ The DOT source of a tree kept as a statement per node and per edge, so a new graph
+    only rebuilds the statements of the nodes that changed and joins them once. Tables
+    contain color placeholders that are replaced, in a single pass, by the colors that
+    are passed to source(). """
+
+    def __init__(self, placeholders):
+        self.placeholder_regex = re.compile('|'.join(re.escape(p) for p in placeholders))
+        self.tables = [] # uncolored table per node_id, None if not rendered yet
+        self.node_stmts = [] # colored statement per node_id, None if not rendered or outdated
+        self.outdated = [] # node_ids with an outdated statement
+        self.edges = [] # (node_id1, node_id2)
+        self.edge_stmts = []
+        self.colors = None
+
+    def __len__(self):
+        return len(self.tables)
+
+    def set_table(self, node_id, table):
+        tables = self.tables
+        while len(tables) <= node_id:
+            tables.append(None)
+            self.node_stmts.append(None)
+        tables[node_id] = table
+        self.node_stmts[node_id] = None
+        self.outdated.append(node_id)
+
+    def remove_table(self, node_id):
+        if node_id < len(self.tables):
+            self.tables[node_id] = None
+            self.node_stmts[node_id] = None
+
+    def add_edge(self, node_id1, node_id2):
+        self.edges.append((node_id1, node_id2))
+        self.edge_stmts.append(f'\t{node_id1} -> {node_id2}\n')
+
+    def remove_edges(self, count):
+        """ Removes all but the first 'count' edges. """
+        del self.edges[count:]
+        del self.edge_stmts[count:]
+
+    def cut_edges(self, start, stop):
+        """ Removes and returns the edges from index 'start' to 'stop'. """
+        edges = self.edges[start:stop]
+        del self.edges[start:stop]
+        del self.edge_stmts[start:stop]
+        return edges
+
+    def insert_edges(self, index, edges):
+        self.edges[index:index] = edges
+        self.edge_stmts[index:index] = [f'\t{node_id1} -> {node_id2}\n' for node_id1, node_id2 in edges]
+
+    def recolor(self, text, colors):
+        return self.placeholder_regex.sub(lambda m: colors[m.group()], text)
+
+    def update_node_stmts(self, colors):
+        if colors != self.colors:
+            self.colors = colors
+            self.node_stmts = [None] * len(self.tables)
+            self.outdated = [nid for nid, table in enumerate(self.tables) if table is not None]
+        node_stmts = self.node_stmts
+        tables = self.tables
+        for nid in self.outdated:
+            if node_stmts[nid] is None and tables[nid] is not None:
+                node_stmts[nid] = f'\t{nid} [label={self.recolor(tables[nid], colors)}]\n'
+        self.outdated = []
+
+    def colored_tables(self, colors):
+        """ Returns the tables per node_id with 'colors' filled in. """
+        return [None if table is None else self.recolor(table, colors) for table in self.tables]
+
+    def view_source(self, header, colors, view, placeholder_tables, reverse=False):
+        """ Returns the DOT source of just the nodes and edges of viewport.View 'view', with
+        the tables of its placeholders in 'placeholder_tables'. """
+        self.update_node_stmts(colors)
+        node_stmts = []
+        shown = set()
+        for dot_id, node_id in view.nodes:
+            if node_id is None:
+                node_stmts.append(f'\t{dot_id} [label={self.recolor(placeholder_tables[dot_id], colors)}]\n')
+            elif self.node_stmts[node_id] is not None:
+                node_stmts.append(self.node_stmts[node_id])
+            else:
+                continue
+            shown.add(dot_id)
+        edge_stmts = [f'\t{id1} -> {id2}\n' for id1, id2 in view.edges if id1 in shown and id2 in shown]
+        if reverse:  # reverse so left to right order is preserved
+            node_stmts.reverse()
+            edge_stmts.reverse()
+        return ''.join((self.recolor(header, colors), ''.join(node_stmts), ''.join(edge_stmts), '}\n'))
+
+    def source(self, header, colors, reverse=False):
+        """ Returns the DOT source with 'header' (without its closing brace) and
+        'colors', a dict from placeholder to quoted color. """
+        self.update_node_stmts(colors)
+        node_stmts = [stmt for stmt in self.node_stmts if stmt is not None]
+        edge_stmts = self.edge_stmts
+        if reverse:  # reverse so left to right order is preserved
+            node_stmts.reverse()
+            edge_stmts = reversed(edge_stmts)
+        return ''.join((self.recolor(header, colors), ''.join(node_stmts), ''.join(edge_stmts), '}\n'))
@@ -0,0 +1,193 @@
+import array
+import atexit
+import struct
+import sys
+import weakref
+
+log_header = b'IVTLOG1\n'
+
+# opcodes in the int stream
+STEP = 0
+EDGE = 1
+
+# node states in a STEP
+PAUSED = 0
+ACTIVE = 1
+RETURNED = 2
+
+events = ('call', 'return', 'line')
+event_codes = {event: code for code, event in enumerate(events)}
+
+def to_little_endian(ints):
+    if sys.byteorder == 'big':
+        ints.byteswap()
+    return ints
+
+live_recorders = weakref.WeakSet() # flushed at exit, a Recorder leaves when closed or collected
+
+def flush_live_recorders():
+    for recorder in list(live_recorders):
+        recorder.flush()
+
+atexit.register(flush_live_recorders)
+
+
+class Recorder:
+    """ Writes the steps of a traced run to a compact binary log instead of rendering them.
+
+    The log is a sequence of blocks. An 'S' block adds strings to the string table, a
+    string is written once and then referred to by its index (0 is None). An 'E' block
+    holds a stream of uint32 records:
+
+        EDGE parent_id child_id
+        STEP event filename line_nr n_updates
+             (node_id state name n_rows (var val)*n_rows return)*n_updates
+
+    where an update holds the unhighlighted strings of a node that is paused, active or
+    returned at that step, as Invocation_Tree.create_graph() would render them. """
+
+    def __init__(self, filename, buffer_size=1<<16):
+        self.filename = filename
+        self.buffer_size = buffer_size
+        self.string_ids = {None: 0}
+        self.new_strings = []
+        self.ints = array.array('I')
+        with open(filename, 'wb') as file:
+            file.write(log_header)
+        live_recorders.add(self)
+
+    def string_id(self, string):
+        string_id = self.string_ids.get(string)
+        if string_id is None:
+            string_id = self.string_ids[string] = len(self.string_ids)
+            self.new_strings.append(string)
+        return string_id
+
+    def record_edge(self, parent_id, child_id):
+        self.ints.extend((EDGE, parent_id, child_id))
+
+    def record_step(self, tree, frame, event):
+        """ Records the nodes that changed in 'tree' since the last step, releases the frames
+        of returned nodes. """
+        string_id = self.string_id
+        ints = self.ints
+        returned = set(tree.returned)
+        updates = [(node, PAUSED) for node in dict.fromkeys(tree.paused) if not node in returned]
+        updates += [(node, RETURNED) for node in tree.returned]
+        if len(tree.stack) > 0:
+            updates.append((tree.stack[-1], ACTIVE))
+        tree.paused = []
+        tree.returned = []
+        ints.extend((STEP, event_codes[event], string_id(frame.f_code.co_filename), frame.f_lineno or 0, len(updates)))
+        for node, state in updates:
+            name_content, rows, return_content = tree.node_contents(node, state == RETURNED)
+            ints.extend((node.node_id, state, string_id(name_content), len(rows)))
+            for var_content, val_content in rows:
+                ints.append(string_id(var_content))
+                ints.append(string_id(val_content))
+            ints.append(string_id(return_content))
+            if state == RETURNED:
+                node.frame = None
+                node.return_value = None
+        if len(ints) >= self.buffer_size:
+            self.flush()
+
+    def flush(self):
+        if len(self.ints) == 0 and len(self.new_strings) == 0:
+            return
+        with open(self.filename, 'ab') as file:
+            if self.new_strings:
+                encoded = [s.encode('utf-8', 'surrogatepass') for s in self.new_strings]
+                lengths = to_little_endian(array.array('I', (len(e) for e in encoded)))
+                file.write(b'S' + struct.pack('<I', len(encoded)) + lengths.tobytes() + b''.join(encoded))
+                self.new_strings = []
+            file.write(b'E' + struct.pack('<I', len(self.ints)) + to_little_endian(self.ints).tobytes())
+            self.ints = array.array('I')
+
+    def close(self):
+        """ Writes what is buffered, after which the log is no longer flushed at exit. """
+        self.flush()
+        live_recorders.discard(self)
+
+
+class Step:
+    """ A recorded step: its event and source location, the edges added since the previous
+    step, and the updates as (node_id, state, (name_content, rows, return_content)). """
+    __slots__ = ('index', 'event', 'filename', 'line_nr', 'edges', 'updates')
+
+    def __init__(self, index, event, filename, line_nr, edges, updates):
+        self.index = index
+        self.event = event
+        self.filename = filename
+        self.line_nr = line_nr
+        self.edges = edges
+        self.updates = updates
+
+    def __repr__(self):
+        return f'Step({self.index}, {self.event!r}, {self.filename}:{self.line_nr}, updates:{len(self.updates)})'
+
+
+def read_blocks(filename):
+    """ Yields the int stream of each 'E' block of a log, with the string table as read so far. """
+    strings = [None]
+    with open(filename, 'rb') as file:
+        if file.read(len(log_header)) != log_header:
+            raise ValueError(f'{filename!r} is not an invocation_tree log')
+        while True:
+            kind = file.read(1)
+            if not kind:
+                break
+            count, = struct.unpack('<I', file.read(4))
+            if kind == b'S':
+                lengths = array.array('I')
+                lengths.frombytes(file.read(4 * count))
+                data = file.read(sum(to_little_endian(lengths)))
+                start = 0
+                for length in lengths:
+                    strings.append(data[start:start+length].decode('utf-8', 'surrogatepass'))
+                    start += length
+            elif kind == b'E':
+                ints = array.array('I')
+                ints.frombytes(file.read(4 * count))
+                yield to_little_endian(ints), strings
+            else:
+                raise ValueError(f'{filename!r} is corrupt, unknown block {kind!r}')
+
+def read_steps(filename):
+    """ Yields the Steps of a log. """
+    edges = []
+    index = 0
+    for ints, strings in read_blocks(filename):
+        i = 0
+        n = len(ints)
+        while i < n:
+            if ints[i] == EDGE:
+                edges.append((ints[i+1], ints[i+2]))
+                i += 3
+                continue
+            event, filename_id, line_nr, n_updates = ints[i+1:i+5]
+            i += 5
+            updates = []
+            for _ in range(n_updates):
+                node_id, state, name_id, n_rows = ints[i:i+4]
+                i += 4
+                rows = [(strings[ints[j]], strings[ints[j+1]]) for j in range(i, i + 2*n_rows, 2)]
+                i += 2 * n_rows
+                updates.append((node_id, state, (strings[name_id], rows, strings[ints[i]])))
+                i += 1
+            yield Step(index, events[event], strings[filename_id], line_nr, edges, updates)
+            edges = []
+            index += 1
+
+
+class Recorded_Frame:
+    """ Stands in for the frame of a recorded step, for printing its source location. """
+    __slots__ = ('co_filename', 'f_lineno')
+
+    def __init__(self, filename, line_nr):
+        self.co_filename = filename
+        self.f_lineno = line_nr
+
+    @property
+    def f_code(self):
+        return self
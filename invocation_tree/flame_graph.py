@@ -0,0 +1,128 @@
+import json
+from array import array
+
+weights = ('calls', 'time')
+
+class Call_Store:
+    """ Per node_id the structure of the tree and what a flame graph needs: the parent node_id,
+    the function name, the number of calls (more than one for a merged node) and, when
+    profiled, the self time. Kept in arrays apart from the tables, so it stays small for
+    millions of calls. Node_ids are in call order, so the subtree of a node is the range
+    of node_ids from itself to its 'end'. """
+
+    def __init__(self):
+        self.parents = array('l') # -1 for a root
+        self.name_ids = array('l')
+        self.calls = array('l')
+        self.self_times = array('d') # seconds
+        self.last_child = array('l') # -1 if none
+        self.prev_sibling = array('l') # -1 if none
+        self.ends = array('l') # node_id after its subtree, -1 while active
+        self.last_root = -1
+        self.names = [] # name_id -> name
+        self.name_index = {} # name -> name_id
+        self.is_timed = False
+
+    def __len__(self):
+        return len(self.parents)
+
+    def add(self, parent_id, name):
+        """ Adds a node with one call, its node_id is the number of nodes before it. """
+        name_id = self.name_index.get(name)
+        if name_id is None:
+            name_id = self.name_index[name] = len(self.names)
+            self.names.append(name)
+        node_id = len(self.parents)
+        if parent_id is None:
+            parent_id = -1
+            self.prev_sibling.append(self.last_root)
+            self.last_root = node_id
+        else:
+            self.prev_sibling.append(self.last_child[parent_id])
+            self.last_child[parent_id] = node_id
+        self.parents.append(parent_id)
+        self.name_ids.append(name_id)
+        self.calls.append(1)
+        self.self_times.append(0.0)
+        self.last_child.append(-1)
+        self.ends.append(-1)
+
+    def set_returned(self, node_id):
+        self.ends[node_id] = len(self.parents)
+
+    def end(self, node_id):
+        end = self.ends[node_id]
+        return len(self.parents) if end < 0 else end
+
+    def add_call(self, node_id):
+        self.calls[node_id] += 1
+
+    def add_time(self, node_id, seconds):
+        self.self_times[node_id] += max(0.0, seconds)
+        self.is_timed = True
+
+    def stacks(self, weight):
+        """ Returns (stacks, stack_weights) where the nodes with the same stack of names are
+        merged, 'stacks' as (parent stack index or -1, name_id) and 'stack_weights' the sum
+        of the 'weight' of their nodes, the number of calls or the self time. """
+        if weight not in weights:
+            raise ValueError(f'unknown weight {weight!r}, use one of: {", ".join(weights)}')
+        if weight == 'time' and not self.is_timed:
+            raise ValueError("weight 'time' needs the times of tree.profile()")
+        values = self.calls if weight == 'calls' else self.self_times
+        stack_index = {}
+        stacks = []
+        stack_weights = []
+        node_stacks = array('l')
+        for parent_id, name_id, value in zip(self.parents, self.name_ids, values):
+            key = (-1 if parent_id < 0 else node_stacks[parent_id], name_id)
+            stack = stack_index.get(key)
+            if stack is None:
+                stack = stack_index[key] = len(stacks)
+                stacks.append(key)
+                stack_weights.append(0)
+            node_stacks.append(stack)
+            stack_weights[stack] += value
+        return stacks, stack_weights
+
+def stack_name_ids(stacks, stack):
+    """ Returns the name_ids of 'stack' from the root. """
+    name_ids = []
+    while stack >= 0:
+        stack, name_id = stacks[stack]
+        name_ids.append(name_id)
+    name_ids.reverse()
+    return name_ids
+
+def collapsed_name(name):
+    return name.replace(';', ':').replace('\n', ' ')
+
+def write_collapsed(store, file, weight='calls'):
+    """ Writes the stacks of 'store' to text 'file' in the collapsed stack format of
+    flamegraph.pl, a line per stack with its weight, time in microseconds. """
+    stacks, stack_weights = store.stacks(weight)
+    names = [collapsed_name(name) for name in store.names]
+    for stack, value in enumerate(stack_weights):
+        if weight == 'time':
+            value = round(value * 1e6)
+        if value > 0:
+            file.write(';'.join([names[name_id] for name_id in stack_name_ids(stacks, stack)]))
+            file.write(f' {value}\n')
+
+def write_speedscope(store, file, weight='calls', name='invocation tree', exporter='invocation_tree'):
+    """ Writes the stacks of 'store' to text 'file' as a speedscope sampled profile. """
+    stacks, stack_weights = store.stacks(weight)
+    file.write('{"$schema": "https://www.speedscope.app/file-format-schema.json", ')
+    file.write(f'"name": {json.dumps(name)}, "exporter": {json.dumps(exporter)}, "activeProfileIndex": 0, ')
+    file.write('"shared": {"frames": [')
+    file.write(', '.join(json.dumps({'name': frame_name}) for frame_name in store.names))
+    unit = 'none' if weight == 'calls' else 'seconds'
+    file.write(']}, "profiles": [{"type": "sampled", ')
+    file.write(f'"name": {json.dumps(name)}, "unit": "{unit}", "startValue": 0, "endValue": {sum(stack_weights)!r}, ')
+    file.write('"samples": [')
+    samples = (stack for stack, value in enumerate(stack_weights) if value > 0)
+    for i, stack in enumerate(samples):
+        file.write((', ' if i else '') + json.dumps(stack_name_ids(stacks, stack)))
+    file.write('], "weights": [')
+    file.write(', '.join(repr(value) for value in stack_weights if value > 0))
+    file.write(']}]}\n')
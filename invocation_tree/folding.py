@@ -0,0 +1,44 @@
+class Fold:
+    """ The nodes shown below a returned node, folded into it: their 'edges' and 'tables' to
+    unfold them again, and the number of 'calls' and the 'depth' of the whole subtree,
+    including what was folded into the nodes below. """
+    __slots__ = ('edges', 'tables', 'calls', 'depth')
+
+    def __init__(self, node_id, edges, tables, folds):
+        self.edges = edges
+        self.tables = tables
+        self.calls = 0
+        self.depth = 0
+        depths = {node_id: 0}
+        for parent_id, child_id in edges: # parents before children
+            depth = depths[child_id] = depths[parent_id] + 1
+            self.calls += 1
+            child_fold = folds.get(child_id)
+            if child_fold is not None:
+                self.calls += child_fold.calls
+                depth += child_fold.depth
+            self.depth = max(self.depth, depth)
+
+def first_edge_below(edges, node_id):
+    """ Returns the index of the first of 'edges', sorted by child node_id, to a child after 'node_id'. """
+    low, high = 0, len(edges)
+    while low < high:
+        mid = (low + high) // 2
+        if edges[mid][1] <= node_id:
+            low = mid + 1
+        else:
+            high = mid
+    return low
+
+def subtree_edges(edges, node_id):
+    """ Returns the range (start, stop) of the 'edges' below 'node_id', which are contiguous
+    as node_ids are in call order. """
+    start = stop = first_edge_below(edges, node_id)
+    below = {node_id}
+    while stop < len(edges) and edges[stop][0] in below:
+        below.add(edges[stop][1])
+        stop += 1
+    return start, stop
+
+def fold_content(fold):
+    return f'▸ {fold.calls:,} calls folded, depth {fold.depth}'
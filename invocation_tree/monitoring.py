@@ -0,0 +1,226 @@
+import sys
+import threading
+import weakref
+
+has_monitoring = hasattr(sys, 'monitoring')  # Python 3.12+
+backends = ('settrace', 'monitoring')
+
+def select_backend(backend):
+    """ Returns the backend to use, falls back to 'settrace' if sys.monitoring is not available. """
+    if backend not in backends:
+        raise ValueError(f'unknown backend {backend!r}, use one of: {", ".join(backends)}')
+    if backend == 'monitoring' and not has_monitoring:
+        return 'settrace'
+    return backend
+
+def claim_tool_id():
+    """ Returns a free sys.monitoring tool id, preferring the profiler id. """
+    tool_ids = [sys.monitoring.PROFILER_ID] + [i for i in range(6) if i != sys.monitoring.PROFILER_ID]
+    for tool_id in tool_ids:
+        if sys.monitoring.get_tool(tool_id) is None:
+            sys.monitoring.use_tool_id(tool_id, 'invocation_tree')
+            return tool_id
+    raise RuntimeError('invocation_tree: no free sys.monitoring tool id, use backend="settrace"')
+
+# code of hidden calls DISABLE'd by a Monitor, that stays disabled across runs until
+# sys.monitoring.restart_events(), which is only called when one of these is shown again
+disabled_hidden_codes = weakref.WeakSet()
+
+
+class Monitor:
+    """ Feeds sys.monitoring (PEP 669) events to Invocation_Tree.trace(). Code that is not
+    shown gets DISABLE'd so it runs at full speed, local events are only registered for
+    the code objects that reach the tree. With 'target_codes' only those code objects
+    are monitored (decorator use), otherwise all code is.
+
+    DISABLE'd code is only re-enabled by sys.monitoring.restart_events(), which is process
+    wide: it also re-enables what other tools, like coverage, DISABLE'd. So it is called
+    only when a filter change shows a hidden call that was DISABLE'd. """
+
+    def __init__(self, tree, target_codes=None):
+        self.tree = tree
+        self.target_codes = target_codes
+        self.tool_id = None
+        self.thread_id = None
+        self.codes = set() # code objects that have local events set
+        self.ignored_codes = set() # code objects of ignored calls, with just ignored_events() set
+        self.ignored_code = None # code of the ignored call that is running, if any
+
+    def local_events(self, each_line):
+        events = sys.monitoring.events
+        local_events = events.PY_RETURN | events.PY_YIELD | events.PY_RESUME
+        if each_line:
+            local_events |= events.LINE
+        return local_events
+
+    def ignored_events(self):
+        """ Returns the events of ignored code: its returns end the ignoring, a resume of a
+        generator starts it again. """
+        events = sys.monitoring.events
+        return events.PY_RESUME | events.PY_RETURN | events.PY_YIELD
+
+    def start(self):
+        events = sys.monitoring.events
+        self.tool_id = claim_tool_id()
+        self.thread_id = threading.get_ident()
+        callbacks = {
+            events.PY_START: self.py_start,
+            events.PY_RESUME: self.py_resume,
+            events.PY_RETURN: self.py_return,
+            events.PY_YIELD: self.py_return,
+            events.PY_UNWIND: self.py_unwind,
+            events.LINE: self.line,
+        }
+        for event, callback in callbacks.items():
+            sys.monitoring.register_callback(self.tool_id, event, callback)
+        if self.target_codes is None:
+            self.restart_disabled()
+            sys.monitoring.set_events(self.tool_id, events.PY_START | events.PY_UNWIND)
+        else:
+            sys.monitoring.set_events(self.tool_id, events.PY_UNWIND)
+            for code, each_line in self.target_codes.items():
+                self.add_target(code, each_line)
+
+    def stop(self):
+        events = sys.monitoring.events
+        sys.monitoring.set_events(self.tool_id, 0)
+        for code in self.codes:
+            sys.monitoring.set_local_events(self.tool_id, code, 0)
+        self.codes.clear()
+        for code in self.ignored_codes:
+            sys.monitoring.set_local_events(self.tool_id, code, 0)
+        self.ignored_codes.clear()
+        self.ignored_code = None
+        for event in (events.PY_START, events.PY_RESUME, events.PY_RETURN,
+                      events.PY_YIELD, events.PY_UNWIND, events.LINE):
+            sys.monitoring.register_callback(self.tool_id, event, None)
+        sys.monitoring.free_tool_id(self.tool_id)
+        self.tool_id = None
+
+    def add_target(self, code, each_line):
+        if code in disabled_hidden_codes: # hidden in an earlier run
+            disabled_hidden_codes.clear()
+            sys.monitoring.restart_events()
+        self.target_codes[code] = each_line
+        local_events = sys.monitoring.events.PY_START | self.local_events(each_line)
+        sys.monitoring.set_local_events(self.tool_id, code, local_events)
+        self.codes.add(code)
+
+    def remove_target(self, code):
+        del self.target_codes[code]
+        sys.monitoring.set_local_events(self.tool_id, code, 0)
+        self.codes.discard(code)
+
+    def ignore(self, code):
+        """ Starts ignoring the call of 'code' until it returns. The events of its children
+        are dropped by the callbacks, so ignoring a call costs the same however many code
+        objects are monitored. """
+        self.ignored_code = code
+        if code not in self.ignored_codes and code not in self.codes:
+            sys.monitoring.set_local_events(self.tool_id, code, self.ignored_events())
+            self.ignored_codes.add(code)
+
+    def resume(self):
+        """ Stops ignoring after the ignored call returned. """
+        self.ignored_code = None
+
+    def restart(self):
+        """ Applies a change in what is shown: sets the events of this tool again, and
+        re-enables DISABLE'd code if a hidden call that was DISABLE'd is shown now. """
+        if self.target_codes is not None:
+            return
+        events = sys.monitoring.events
+        sys.monitoring.set_events(self.tool_id, events.PY_START | events.PY_UNWIND)
+        local_events = self.local_events(self.tree.each_line)
+        for code in self.codes:
+            sys.monitoring.set_local_events(self.tool_id, code, local_events)
+        for code in self.ignored_codes - self.codes:
+            sys.monitoring.set_local_events(self.tool_id, code, self.ignored_events())
+        self.restart_disabled()
+
+    def restart_disabled(self):
+        """ Re-enables all DISABLE'd code if the tree shows a hidden call that was DISABLE'd. """
+        tree = self.tree
+        for code in disabled_hidden_codes:
+            name = code.co_name # DISABLE'd code has no 'self', so its name is just that
+            if (not tree.regset_hide_calls.match(name, tree.hide_calls) or
+                tree.regset_ignore_calls.match(name, tree.ignore_calls)):
+                disabled_hidden_codes.clear()
+                sys.monitoring.restart_events()
+                return
+
+    def py_start(self, code, offset):
+        if self.ignored_code is not None or threading.get_ident() != self.thread_id:
+            return
+        frame = sys._getframe(1)
+        if self.target_codes is not None:
+            self.tree.trace(frame, 'call', None)
+            return
+        is_traced = self.tree.trace(frame, 'call', None)
+        info = self.tree.code_infos.get(frame)
+        if info.is_external:
+            return sys.monitoring.DISABLE
+        if info.is_hidden and not self.tree.code_infos.depends_on_class(code):
+            disabled_hidden_codes.add(code)
+            return sys.monitoring.DISABLE
+        if frame is self.tree.ignoring_frame:
+            self.ignore(code)
+        elif is_traced and code not in self.codes:
+            sys.monitoring.set_local_events(self.tool_id, code, self.local_events(self.tree.each_line))
+            self.codes.add(code)
+
+    def py_resume(self, code, offset):
+        if self.ignored_code is None and threading.get_ident() == self.thread_id:
+            frame = sys._getframe(1)
+            self.tree.trace(frame, 'call', None)
+            if frame is self.tree.ignoring_frame:
+                self.ignore(code)
+
+    def py_return(self, code, offset, retval):
+        if threading.get_ident() == self.thread_id:
+            frame = sys._getframe(1)
+            if self.ignored_code is not None:
+                if frame is self.tree.ignoring_frame:
+                    self.tree.trace(frame, 'return', retval)
+                    self.resume()
+                return
+            self.tree.trace(frame, 'return', retval)
+
+    def py_unwind(self, code, offset, exception):
+        if (code in self.codes or code is self.ignored_code) and threading.get_ident() == self.thread_id:
+            frame = sys._getframe(1)
+            if self.ignored_code is not None:
+                if frame is self.tree.ignoring_frame:
+                    self.tree.trace(frame, 'return', None)
+                    self.resume()
+                return
+            self.tree.trace(frame, 'return', None)
+
+    def line(self, code, line_number):
+        if self.ignored_code is None and threading.get_ident() == self.thread_id:
+            self.tree.trace(sys._getframe(1), 'line', None)
+
+
+decorator_monitor = None  # Monitor shared by all decorated functions
+
+def call_monitored(tree, fun, args, kwargs, each_line):
+    """ Calls decorated 'fun' with its code monitored and shown in 'tree'. """
+    global decorator_monitor
+    code = fun.__code__
+    if decorator_monitor is not None and decorator_monitor.tree is not tree:
+        decorator_monitor.stop()
+        decorator_monitor = None
+    if decorator_monitor is None:
+        decorator_monitor = Monitor(tree, target_codes={})
+        decorator_monitor.start()
+    monitor = decorator_monitor
+    if code in monitor.target_codes: # recursion, already monitored
+        return fun(*args, **kwargs)
+    monitor.add_target(code, each_line)
+    try:
+        return fun(*args, **kwargs)
+    finally:
+        monitor.remove_target(code)
+        if len(monitor.target_codes) == 0 and monitor is decorator_monitor:
+            monitor.stop()
+            decorator_monitor = None
@@ -0,0 +1,33 @@
+import time
+
+class Notebook_Display:
+    """ Shows the tree as SVG in a single output area of a Jupyter notebook, updated in place
+    through a display handle, without writing files or starting a viewer. Updates come at
+    most 'frame_rate' times per second, see is_due(), and a frame equal to the one shown
+    is not sent. """
+
+    def __init__(self, frame_rate):
+        try:
+            from IPython.display import display, SVG
+        except ImportError as e:
+            raise ImportError("renderer 'jupyter' needs IPython, use it in a Jupyter notebook") from e
+        self.display = display
+        self.svg_class = SVG
+        self.frame_rate = frame_rate
+        self.handle = None
+        self.shown_svg = None
+        self.shown_time = None
+
+    def is_due(self):
+        """ Returns True if enough time passed since the last frame to show the next. """
+        return (self.shown_time is None or self.frame_rate is None or
+                time.perf_counter() - self.shown_time >= 1 / self.frame_rate)
+
+    def show(self, svg):
+        if svg != self.shown_svg:
+            if self.handle is None:
+                self.handle = self.display(self.svg_class(data=svg), display_id=True)
+            else:
+                self.handle.update(self.svg_class(data=svg))
+            self.shown_svg = svg
+        self.shown_time = time.perf_counter()
@@ -0,0 +1,69 @@
+import time
+
+# phase -> method of Invocation_Tree that is timed, times are inclusive so 'build_html_table'
+# includes the 'value_to_string' and 'highlight_diff' calls it makes
+phase_methods = {
+    'value_to_string': 'value_to_string',
+    'highlight_diff': 'highlight_content',
+    'highlight_container': 'highlight_container',
+    'build_html_table': 'build_html_table',
+    'update_tables': 'update_tables',
+    'recolor_last_graph': 'recolor_last_graph',
+    'render': 'render_graph',
+    'input': 'wait_for_enter',
+}
+
+class Phase_Stats:
+    """ Counts the events a tree receives and drops, and the calls and cumulative time per
+    phase. Collected by wrapping the methods of just the 'tree' instance, so a tree that
+    doesn't collect stats runs without any overhead. """
+
+    def __init__(self, tree):
+        self.events_received = 0
+        self.events_dropped = 0
+        self.calls = dict.fromkeys(phase_methods, 0)
+        self.times = dict.fromkeys(phase_methods, 0.0)
+        self.wrap_trace(tree)
+        for phase, method_name in phase_methods.items():
+            self.wrap_phase(tree, phase, method_name)
+
+    def wrap_trace(self, tree):
+        trace = tree.trace
+
+        def counted_trace(frame, event, arg):
+            self.events_received += 1
+            is_traced = trace(frame, event, arg)
+            if not is_traced:
+                self.events_dropped += 1
+            return is_traced
+        tree.trace = counted_trace
+
+    def wrap_phase(self, tree, phase, method_name):
+        method = getattr(tree, method_name)
+        calls = self.calls
+        times = self.times
+        perf_counter = time.perf_counter
+
+        def timed(*args, **kwargs):
+            start = perf_counter()
+            try:
+                return method(*args, **kwargs)
+            finally:
+                times[phase] += perf_counter() - start
+                calls[phase] += 1
+        setattr(tree, method_name, timed)
+
+    def as_dict(self):
+        return {
+            'events_received': self.events_received,
+            'events_dropped': self.events_dropped,
+            'phases': {phase: {'calls': self.calls[phase], 'seconds': self.times[phase]}
+                       for phase in phase_methods},
+        }
+
+    def __str__(self):
+        lines = [f'events received: {self.events_received}, dropped by filter: {self.events_dropped}',
+                 f'{"phase":20} {"calls":>9} {"seconds":>10}']
+        for phase in phase_methods:
+            lines.append(f'{phase:20} {self.calls[phase]:9} {self.times[phase]:10.4f}')
+        return '\n'.join(lines)
@@ -0,0 +1,149 @@
+import math
+import time
+
+# the heat color of a node goes from cold to hot on a log scale of its inclusive time
+heat_min_seconds = 1e-5
+heat_max_seconds = 1.0
+cold_color = (0x33, 0x66, 0xff)
+hot_color = (0xff, 0x22, 0x00)
+
+calibrated_overheads = {} # backend -> (wall, cpu) seconds per event
+
+class Node_Timing:
+    """ The wall and CPU time of a call, inclusive of its children, and the number of calls in
+    its subtree. The times of the children are summed to get the exclusive times. """
+    __slots__ = ('wall_start', 'cpu_start', 'wall', 'cpu', 'child_wall', 'child_cpu', 'calls')
+
+    def __init__(self, wall_start, cpu_start):
+        self.wall_start = wall_start
+        self.cpu_start = cpu_start
+        self.wall = None # None until returned
+        self.cpu = None
+        self.child_wall = 0.0
+        self.child_cpu = 0.0
+        self.calls = 0
+
+    def self_wall(self):
+        return self.wall - self.child_wall
+
+    def self_cpu(self):
+        return self.cpu - self.child_cpu
+
+
+class Profiler:
+    """ Keeps the clocks of the traced program, which stand still while the tree handles an
+    event. The time of handling is measured, and 'overhead' (wall, cpu) per event is added
+    for the part of the tracing that can't be measured, like calling the tracer. """
+
+    def __init__(self, overhead):
+        self.wall_overhead, self.cpu_overhead = overhead
+        self.tracer_wall = 0.0 # time taken out of the clocks so far
+        self.tracer_cpu = 0.0
+        self.event_wall = 0.0 # program clocks at the start of the current event
+        self.event_cpu = 0.0
+
+    def wrap(self, trace):
+        """ Returns 'trace' wrapped so its time is taken out of the program clocks. """
+        perf_counter = time.perf_counter
+        process_time = time.process_time
+
+        def timed_trace(frame, event, arg):
+            wall = perf_counter()
+            cpu = process_time()
+            self.event_wall = wall - self.tracer_wall
+            self.event_cpu = cpu - self.tracer_cpu
+            try:
+                return trace(frame, event, arg)
+            finally:
+                self.tracer_cpu += process_time() - cpu + self.cpu_overhead
+                self.tracer_wall += perf_counter() - wall + self.wall_overhead
+        return timed_trace
+
+    def start(self, node):
+        node.timing = Node_Timing(self.event_wall, self.event_cpu)
+
+    def stop(self, node, parent):
+        timing = node.timing
+        if timing is None: # called before profiling started
+            return
+        timing.wall = max(0.0, self.event_wall - timing.wall_start)
+        timing.cpu = max(0.0, self.event_cpu - timing.cpu_start)
+        if parent is not None and parent.timing is not None:
+            parent_timing = parent.timing
+            parent_timing.child_wall += timing.wall
+            parent_timing.child_cpu += timing.cpu
+            parent_timing.calls += timing.calls + 1
+
+
+# compiled outside the package, as the tree doesn't trace the calls of its own code
+calibration_source = """
+def empty():
+    pass
+
+def run(calls):
+    for _ in range(calls):
+        empty()
+"""
+
+def calibration_run():
+    """ Returns the function that calibrate() traces, run(calls) calls an empty function. """
+    namespace = {}
+    exec(compile(calibration_source, '<calibration>', 'exec'), namespace)
+    return namespace['run']
+
+def calibrate(tree_class, backend, calls=20000):
+    """ Returns the (wall, cpu) seconds per event of tracing with 'backend' that a Profiler
+    can't measure, by tracing calls of an empty function with a tree that does nothing. """
+    if backend in calibrated_overheads:
+        return calibrated_overheads[backend]
+    run = calibration_run()
+
+    def clocks():
+        return time.perf_counter(), time.process_time()
+
+    run(calls) # warm up
+    wall, cpu = clocks()
+    run(calls)
+    end_wall, end_cpu = clocks()
+    untraced = (end_wall - wall, end_cpu - cpu)
+    tree = tree_class(render=False, show=False, block=False, backend=backend)
+    profiler = Profiler((0.0, 0.0))
+    events = 0
+
+    def count(frame, event, arg):
+        nonlocal events
+        events += 1
+        return True
+
+    tree.trace = profiler.wrap(count)
+    wall, cpu = clocks()
+    tree(run, calls)
+    end_wall, end_cpu = clocks()
+    if events < 2 * calls:
+        raise RuntimeError(f'calibrating backend {backend!r} got {events} events, expected at least {2 * calls}')
+    overhead = (max(0.0, (end_wall - wall - untraced[0] - profiler.tracer_wall) / events),
+                max(0.0, (end_cpu - cpu - untraced[1] - profiler.tracer_cpu) / events))
+    calibrated_overheads[backend] = overhead
+    return overhead
+
+def format_seconds(seconds):
+    if seconds < 1e-3:
+        return f'{seconds*1e6:.3g}µs'
+    if seconds < 1:
+        return f'{seconds*1e3:.3g}ms'
+    return f'{seconds:.3g}s'
+
+def heat_color(seconds):
+    """ Returns the color of 'seconds' between 'cold_color' and 'hot_color'. """
+    if seconds <= heat_min_seconds:
+        heat = 0.0
+    else:
+        heat = min(1.0, math.log(seconds / heat_min_seconds) / math.log(heat_max_seconds / heat_min_seconds))
+    return '#' + ''.join(f'{round(c + (h - c) * heat):02x}' for c, h in zip(cold_color, hot_color))
+
+def timing_content(timing):
+    """ Returns the HTML content of the timing row of a returned call. """
+    content = (f'time {format_seconds(timing.wall)} (self {format_seconds(max(0.0, timing.self_wall()))}), '
+               f'cpu {format_seconds(timing.cpu)} (self {format_seconds(max(0.0, timing.self_cpu()))}), '
+               f'calls {timing.calls}')
+    return f'<FONT COLOR="{heat_color(timing.wall)}">{content}</FONT>'
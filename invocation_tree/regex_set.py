@@ -1,29 +1,44 @@
 import re
+import invocation_tree.versioned as versioned
 
 class Regex_Set:
+    """ Matches strings against a set of targets, each an exact string or a regular
+    expression with a 're:' prefix. Verdicts are memoized per compiled pattern. """
+    max_memo_size = 10000
 
     def __init__(self, target_set=None):
         self.target_set = None
+        self.tracker = versioned.Change_Tracker()
         self.compiled_pattern = None
+        self.memo = {}
         if target_set is not None:
             self.update_pattern(target_set)
 
     def update_pattern(self, target_set):
-        if not target_set == self.target_set:
-            self.target_set = target_set.copy()
-            pattern = '^('
-            sep = ''
-            for target in self.target_set:
-                target = target.strip()
-                if target[:3] == 're:':
-                    pattern += sep + '(' + target[3:] + ')'
-                else:
-                    pattern += sep + re.escape(target)
-                sep = '|'
-            pattern += ')$'
-            self.compiled_pattern = re.compile(pattern)
+        """ Recompiles the pattern if 'target_set' changed, returns True if it did. A set
+        with a 'version' (see versioned.Versioned_Set) is checked by version, others by value. """
+        if not self.tracker.changed(target_set):
+            return False
+        self.target_set = set(target_set)
+        pattern = '^('
+        sep = ''
+        for target in self.target_set:
+            target = target.strip()
+            if target[:3] == 're:':
+                pattern += sep + '(' + target[3:] + ')'
+            else:
+                pattern += sep + re.escape(target)
+            sep = '|'
+        pattern += ')$'
+        self.compiled_pattern = re.compile(pattern)
+        self.memo.clear()
+        return True
 
     def match(self, s, target_set):
         self.update_pattern(target_set)
-        return self.compiled_pattern.match(s) is not None
-
+        is_match = self.memo.get(s)
+        if is_match is None:
+            if len(self.memo) >= self.max_memo_size:
+                self.memo.clear()
+            is_match = self.memo[s] = self.compiled_pattern.match(s) is not None
+        return is_match
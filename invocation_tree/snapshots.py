@@ -0,0 +1,119 @@
+import operator
+
+from invocation_tree.bounded_str import container_types
+from invocation_tree.structural_diff import immutable_types
+
+class Frozen:
+    """ A container as it was at a step: its type, its 'originals' (the keys followed by the
+    values for a dict) to detect changes by identity, and its 'elements', the originals
+    with each container replaced by its own Frozen. """
+    __slots__ = ('value_type', 'originals', 'elements', 'is_flat')
+
+    def __init__(self, value_type, originals, elements, is_flat):
+        self.value_type = value_type
+        self.originals = originals
+        self.elements = elements
+        self.is_flat = is_flat # just immutable elements
+
+def container_originals(value):
+    if type(value) is dict:
+        return tuple(value) + tuple(value.values())
+    return tuple(value)
+
+class Snapshot_Store:
+    """ Captures values with structural sharing: the Frozen of a container is kept by object
+    id and is reused as long as the container holds the same elements, so a container is
+    copied again only when its contents, or those of a container in it, changed. Other
+    values are captured by reference. """
+
+    def __init__(self):
+        self.versions = {} # id -> Frozen last captured
+        self.active_ids = set() # containers being captured, for recursive containers
+
+    def capture(self, value):
+        value_type = type(value)
+        if value_type not in container_types:
+            return value
+        value_id = id(value)
+        if value_id in self.active_ids:
+            return value
+        originals = container_originals(value)
+        frozen = self.versions.get(value_id)
+        if (frozen is not None and frozen.value_type is value_type and
+            len(frozen.originals) == len(originals) and all(map(operator.is_, originals, frozen.originals))):
+            if frozen.is_flat:
+                return frozen
+            elements = self.capture_elements(value_id, originals)
+            if all(map(operator.is_, elements, frozen.elements)):
+                return frozen
+        elif immutable_types.issuperset(map(type, originals)):
+            frozen = self.versions[value_id] = Frozen(value_type, originals, originals, True)
+            return frozen
+        else:
+            elements = self.capture_elements(value_id, originals)
+        frozen = self.versions[value_id] = Frozen(value_type, originals, elements, False)
+        return frozen
+
+    def capture_elements(self, value_id, originals):
+        self.active_ids.add(value_id)
+        try:
+            return tuple([self.capture(element) for element in originals])
+        finally:
+            self.active_ids.discard(value_id)
+
+def thaw(captured, memo):
+    """ Returns a new container with the contents of Frozen 'captured', or 'captured' itself
+    if it is not Frozen. 'memo' maps the id of each Frozen to its new container, so that
+    shared parts are thawed once. """
+    if type(captured) is not Frozen:
+        return captured
+    value = memo.get(id(captured))
+    if value is None:
+        elements = [thaw(element, memo) for element in captured.elements]
+        if captured.value_type is dict:
+            half = len(elements) // 2
+            value = dict(zip(elements[:half], elements[half:]))
+        else:
+            value = captured.value_type(elements)
+        memo[id(captured)] = value
+    return value
+
+
+class History:
+    """ The steps of a traced run, per step its location, the edges it added and the nodes
+    that changed as (node_id, state, capture). A capture holds the values of a node as
+    captured by the Snapshot_Store, so the steps share the containers that didn't change
+    and the history grows with the changes, not with the size of the state. """
+
+    def __init__(self):
+        self.store = Snapshot_Store()
+        self.locations = [] # per step: (event, filename, line_nr)
+        self.step_edges = [] # per step: [(parent_id, child_id), ...]
+        self.step_updates = [] # per step: [(node_id, state, capture), ...]
+        self.edges = [] # added since the last step
+
+    def __len__(self):
+        return len(self.locations)
+
+    def __repr__(self):
+        return f'History(steps={len(self)})'
+
+    def add_edge(self, parent_id, child_id):
+        self.edges.append((parent_id, child_id))
+
+    def add_step(self, event, filename, line_nr, updates):
+        self.locations.append((event, filename, line_nr))
+        self.step_edges.append(self.edges)
+        self.step_updates.append(updates)
+        self.edges = []
+
+    def state_at(self, index):
+        """ Returns (edges, states) of the tree at step 'index', 'states' maps node_id to the
+        last (state, capture) of the node up to that step. """
+        edges = []
+        states = {}
+        for i in range(index + 1):
+            edges.extend(self.step_edges[i])
+            for node_id, state, capture in self.step_updates[i]:
+                states[node_id] = (state, capture)
+        return edges, states
@@ -0,0 +1,86 @@
+import atexit
+import json
+import os
+import weakref
+
+span_formats = ('jsonl', 'chrome')
+
+live_writers = weakref.WeakSet() # flushed at exit, a Span_Writer leaves when closed or collected
+
+def flush_live_writers():
+    for writer in list(live_writers):
+        writer.flush()
+
+atexit.register(flush_live_writers)
+
+class Span_Writer:
+    """ Streams each call shown in the tree as a begin and an end span to a file while the
+    program runs, in 'jsonl' (a JSON object per line) or 'chrome' trace event format (for
+    Perfetto and chrome://tracing). Spans are buffered and appended every 'buffer_size'
+    spans, so memory stays bounded however long the run. The closing bracket of the
+    'chrome' array is left out, which the format allows, so the file is valid after any
+    flush. """
+
+    def __init__(self, filename, format=None, buffer_size=1000):
+        if format is None:
+            format = 'jsonl' if filename.endswith('.jsonl') else 'chrome'
+        if format not in span_formats:
+            raise ValueError(f'unknown span format {format!r}, use one of: {", ".join(span_formats)}')
+        self.filename = filename
+        self.format = format
+        self.buffer_size = buffer_size
+        self.spans = []
+        self.span_count = 0
+        self.pid = os.getpid()
+        self.start = None # seconds of the first span
+        with open(filename, 'w', encoding='utf-8') as file:
+            if format == 'chrome':
+                file.write('[\n')
+        live_writers.add(self)
+
+    def timestamp(self, seconds):
+        """ Returns the microseconds since the first span. """
+        if self.start is None:
+            self.start = seconds
+        return round((seconds - self.start) * 1e6, 3)
+
+    def begin(self, node_id, parent_id, name, values, seconds):
+        """ Writes the span that starts call 'node_id' with its arguments in 'values'. """
+        if self.format == 'jsonl':
+            self.write({'type': 'begin', 'node_id': node_id, 'parent_id': parent_id, 'name': name,
+                        'ts': self.timestamp(seconds), 'locals': values})
+        else:
+            self.write({'name': name, 'ph': 'B', 'ts': self.timestamp(seconds), 'pid': self.pid, 'tid': 1,
+                        'args': {'node_id': node_id, 'parent_id': parent_id, 'locals': values}})
+
+    def end(self, node_id, parent_id, name, values, return_value, seconds):
+        """ Writes the span that ends call 'node_id' with its locals and return value, the
+        return value is None if it is hidden. """
+        if self.format == 'jsonl':
+            self.write({'type': 'end', 'node_id': node_id, 'parent_id': parent_id, 'name': name,
+                        'ts': self.timestamp(seconds), 'locals': values, 'return': return_value})
+        else:
+            self.write({'name': name, 'ph': 'E', 'ts': self.timestamp(seconds), 'pid': self.pid, 'tid': 1,
+                        'args': {'node_id': node_id, 'parent_id': parent_id, 'locals': values,
+                                 'return': return_value}})
+
+    def write(self, span):
+        self.spans.append(json.dumps(span, ensure_ascii=False))
+        if len(self.spans) >= self.buffer_size:
+            self.flush()
+
+    def flush(self):
+        if len(self.spans) == 0:
+            return
+        with open(self.filename, 'a', encoding='utf-8') as file:
+            if self.format == 'jsonl':
+                file.write('\n'.join(self.spans) + '\n')
+            else:
+                file.write((',\n' if self.span_count else '') + ',\n'.join(self.spans))
+        self.span_count += len(self.spans)
+        self.spans = []
+
+    def close(self):
+        """ Writes what is buffered, after which the file is no longer flushed at exit. """
+        self.flush()
+        live_writers.discard(self)
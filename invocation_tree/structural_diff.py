@@ -0,0 +1,144 @@
+import html
+import itertools
+import operator
+
+from invocation_tree.bounded_str import container_types, empty_strs, tail_repr
+
+immutable_types = {int, float, complex, bool, str, bytes, type(None)}
+
+class Snapshot:
+    """ A container as last shown. For a list or tuple that was shown completely a copy of
+    its 'items' and the string per index in 'pieces', otherwise the element and its string
+    per key (index for a list or tuple) of the shown elements in 'elements'. """
+    __slots__ = ('value_type', 'length', 'items', 'pieces', 'elements')
+
+    def __init__(self, value_type, length, items=None, pieces=None, elements=None):
+        self.value_type = value_type
+        self.length = length
+        self.items = items
+        self.pieces = pieces
+        self.elements = elements # key -> (element, string)
+
+def element_str(element, budget, active_ids):
+    string = tail_repr(element, budget + 1, active_ids)
+    if len(string) > budget:
+        string = '...' + string[-budget:]
+    return html.escape(string)
+
+def sequence_pieces(value, snapshot, budget):
+    """ Returns (pieces, highlighted pieces, Snapshot, is_highlighted) of the elements of list
+    or tuple 'value' that fit in 'budget', from the end, when it was shown completely in
+    'snapshot'. Elements that are the same object as in 'snapshot' are found without a
+    Python loop, and if immutable keep their string, so the cost is in the changed elements. """
+    items = list(value)
+    n = len(items)
+    active_ids = {id(value)}
+    old_pieces = snapshot.pieces
+    pieces = old_pieces[:n]
+    pieces.extend([None] * (n - len(pieces)))
+    changed = list(itertools.compress(itertools.count(), map(operator.is_not, items, snapshot.items)))
+    for i in changed:
+        pieces[i] = element_str(items[i], budget, active_ids)
+    changed.extend(range(len(snapshot.items), n))
+    all_immutable = immutable_types.issuperset(map(type, items))
+    start = 0
+    if not all_immutable or None in pieces or sum(map(len, pieces)) + 2 * n > budget:
+        length = 0
+        start = n
+        while start > 0 and length < budget:
+            start -= 1
+            element = items[start]
+            if pieces[start] is None or type(element) not in immutable_types:
+                pieces[start] = element_str(element, budget, active_ids)
+            length += len(pieces[start]) + 2
+    visible = pieces[start:]
+    highlighted = visible[:]
+    is_highlighted = False
+    if all_immutable:
+        indices = [i for i in changed if i >= start]
+    else: # mutable elements can change without changing identity
+        indices = range(start, n)
+    for i in indices:
+        if i >= len(old_pieces) or old_pieces[i] != visible[i-start]:
+            highlighted[i-start] = f'<B>{visible[i-start]}</B>'
+            is_highlighted = True
+    if start > 0: # no longer fits, continue with just the shown elements
+        visible.insert(0, '...')
+        highlighted.insert(0, '...')
+        elements = {i: (items[i], pieces[i]) for i in range(start, n)}
+        return visible, highlighted, Snapshot(type(value), n, elements=elements), is_highlighted
+    return visible, highlighted, Snapshot(type(value), n, items=items, pieces=pieces), is_highlighted
+
+def reversed_elements(value):
+    """ Yields (key, element) of the elements of 'value' from the end, the key of an element of
+    a list or tuple is its index. """
+    value_type = type(value)
+    if value_type is dict:
+        return reversed(value.items())
+    if value_type is list or value_type is tuple:
+        return ((i, value[i]) for i in range(len(value)-1, -1, -1))
+    return ((element, element) for element in reversed(list(value)))
+
+def keyed_pieces(value, snapshot, budget):
+    """ Returns (pieces, highlighted pieces, Snapshot, is_highlighted) of the elements of 'value'
+    that fit in 'budget', from the end, comparing just those elements with 'snapshot'. """
+    is_dict = type(value) is dict
+    old_elements = {} if snapshot is None else snapshot.elements
+    elements = {}
+    pieces = []
+    highlighted = []
+    is_highlighted = False
+    length = 0
+    active_ids = {id(value)}
+    for key, element in reversed_elements(value):
+        if length >= budget:
+            pieces.append('...')
+            highlighted.append('...')
+            break
+        old = old_elements.get(key)
+        if old is not None and old[0] is element and type(element) in immutable_types:
+            piece = old[1]
+        elif is_dict:
+            piece = element_str(key, budget, active_ids) + ': ' + element_str(element, budget, active_ids)
+        else:
+            piece = element_str(element, budget, active_ids)
+        elements[key] = (element, piece)
+        pieces.append(piece)
+        if old is None or old[1] != piece:
+            highlighted.append(f'<B>{piece}</B>')
+            is_highlighted = True
+        else:
+            highlighted.append(piece)
+        length += len(piece) + 2
+    pieces.reverse()
+    highlighted.reverse()
+    if not is_dict and pieces[0] != '...' and type(value) is not set and type(value) is not frozenset:
+        return pieces, highlighted, Snapshot(type(value), len(value), items=list(value), pieces=pieces), is_highlighted
+    return pieces, highlighted, Snapshot(type(value), len(value), elements=elements), is_highlighted
+
+def highlight_container(value, snapshot, budget):
+    """ Returns (highlighted content, content, new Snapshot, is_highlighted) of container 'value',
+    where compared to 'snapshot' the elements that changed are highlighted element by element
+    instead of by string diff. Only the elements that fit in 'budget' are shown, and an
+    element is only converted to string again if it is not the same immutable object. """
+    value_type = type(value)
+    open_str, close_str, _ = container_types[value_type]
+    if snapshot is not None and snapshot.value_type is not value_type:
+        snapshot = None
+    if len(value) == 0:
+        content = empty_strs[value_type]
+        is_changed = snapshot is None or snapshot.length != 0
+        return (f'<B>{content}</B>' if is_changed else content), content, Snapshot(value_type, 0, elements={}), is_changed
+    if value_type is tuple and len(value) == 1:
+        close_str = ',' + close_str
+    if snapshot is not None and snapshot.items is not None:
+        pieces, highlighted, new_snapshot, is_highlighted = sequence_pieces(value, snapshot, budget)
+    else:
+        pieces, highlighted, new_snapshot, is_highlighted = keyed_pieces(value, snapshot, budget)
+    content = open_str + ', '.join(pieces) + close_str
+    if snapshot is None:
+        return f'<B>{content}</B>', content, new_snapshot, True
+    if snapshot.length != len(value):
+        close_str = f'<B>{close_str}</B>'
+        is_highlighted = True
+    return open_str + ', '.join(highlighted) + close_str, content, new_snapshot, is_highlighted
@@ -0,0 +1,284 @@
+import html
+import re
+
+# estimated glyph widths in em, there are no font metrics without graphviz
+char_width = 0.56
+bold_char_width = 0.62
+wide_char_width = 1.0
+line_height = 1.25 # in em
+cell_padding = 4
+sibling_gap = 14
+level_gap = 36
+margin = 8
+
+attribute_regex = re.compile(r'(\w+)="([^"]*)"')
+cell_regex = re.compile(r'<TD[^>]*>(.*?)</TD>', re.S)
+markup_regex = re.compile(r'(<B>|</B>|<S>|</S>|<FONT COLOR="[^"]*">|</FONT>|<BR/>)')
+zero_width_chars = '\u200b'
+
+def parse_table(table):
+    """ Returns the attributes of the TABLE tag of a node table and its lines of text, each line
+    a list of (text, is_bold, is_struck, color) pieces, color None for the table color. """
+    start = table.index('<TABLE')
+    attributes = dict(attribute_regex.findall(table, start, table.index('>', start)))
+    lines = []
+    for cell in cell_regex.findall(table):
+        line = []
+        is_bold = is_struck = False
+        color = None
+        for token in markup_regex.split(cell):
+            if token == '<B>':
+                is_bold = True
+            elif token == '</B>':
+                is_bold = False
+            elif token == '<S>':
+                is_struck = True
+            elif token == '</S>':
+                is_struck = False
+            elif token.startswith('<FONT'):
+                color = token[13:-2]
+            elif token == '</FONT>':
+                color = None
+            elif token == '<BR/>':
+                lines.append(line)
+                line = []
+            elif token:
+                line.append((html.unescape(token), is_bold, is_struck, color))
+        lines.append(line)
+    return attributes, lines
+
+def text_width(line, fontsize):
+    width = 0
+    for text, is_bold, is_struck, color in line:
+        for c in text:
+            if c in zero_width_chars:
+                continue
+            width += wide_char_width if ord(c) > 0x2000 else bold_char_width if is_bold else char_width
+    return width * fontsize
+
+
+class Layout_Node:
+    """ A node of the tidy tree layout. 'breadth' is its size along the siblings and 'extent'
+    its size along the depth, which are width and height in vertical layout. """
+    __slots__ = ('node_id', 'attributes', 'lines', 'width', 'height', 'breadth', 'extent',
+                 'parent', 'children', 'number', 'depth',
+                 'prelim', 'mod', 'shift', 'change', 'thread', 'ancestor', 'x', 'y')
+
+    def __init__(self, node_id, attributes, lines, width, height, horizontal):
+        self.node_id = node_id
+        self.attributes = attributes
+        self.lines = lines
+        self.width = width
+        self.height = height
+        self.breadth, self.extent = (height, width) if horizontal else (width, height)
+        self.parent = None
+        self.children = []
+        self.number = 0 # index among siblings
+        self.depth = 0
+        self.prelim = 0.0
+        self.mod = 0.0
+        self.shift = 0.0
+        self.change = 0.0
+        self.thread = None
+        self.ancestor = self
+        self.x = 0.0
+        self.y = 0.0
+
+    def next_left(self):
+        return self.children[0] if self.children else self.thread
+
+    def next_right(self):
+        return self.children[-1] if self.children else self.thread
+
+    def left_sibling(self):
+        return self.parent.children[self.number-1] if self.number > 0 else None
+
+
+def distance(left, right):
+    return (left.breadth + right.breadth) / 2 + sibling_gap
+
+def move_subtree(left, right, shift):
+    subtrees = right.number - left.number
+    right.change -= shift / subtrees
+    right.shift += shift
+    left.change += shift / subtrees
+    right.prelim += shift
+    right.mod += shift
+
+def execute_shifts(node):
+    shift = change = 0.0
+    for child in reversed(node.children):
+        child.prelim += shift
+        child.mod += shift
+        change += child.change
+        shift += child.shift + change
+
+def apportion(node, default_ancestor):
+    """ Moves the subtree of 'node' right until its left contour clears the right contour of
+    the subtrees of its left siblings, spreading the shift over the siblings in between. """
+    left_sibling = node.left_sibling()
+    if left_sibling is None:
+        return default_ancestor
+    vip = vop = node
+    vim = left_sibling
+    vom = node.parent.children[0]
+    sip, sop, sim, som = vip.mod, vop.mod, vim.mod, vom.mod
+    while vim.next_right() is not None and vip.next_left() is not None:
+        vim = vim.next_right()
+        vip = vip.next_left()
+        vom = vom.next_left()
+        vop = vop.next_right()
+        vop.ancestor = node
+        shift = (vim.prelim + sim) - (vip.prelim + sip) + distance(vim, vip)
+        if shift > 0:
+            ancestor = vim.ancestor if vim.ancestor.parent is node.parent else default_ancestor
+            move_subtree(ancestor, node, shift)
+            sip += shift
+            sop += shift
+        sim += vim.mod
+        sip += vip.mod
+        som += vom.mod
+        sop += vop.mod
+    if vim.next_right() is not None and vop.next_right() is None:
+        vop.thread = vim.next_right()
+        vop.mod += sim - sop
+    if vip.next_left() is not None and vom.next_left() is None:
+        vom.thread = vip.next_left()
+        vom.mod += sip - som
+        default_ancestor = node
+    return default_ancestor
+
+def postorder(root):
+    order = []
+    stack = [root]
+    while stack:
+        node = stack.pop()
+        order.append(node)
+        stack.extend(node.children)
+    order.reverse()
+    return order
+
+def tidy_layout(root):
+    """ Sets the 'x' (along the siblings) of all nodes under 'root' with the linear time
+    Walker algorithm as improved by Buchheim, Jünger and Leipert. Iterative, as trees of
+    recursive calls can be deeper than the recursion limit. """
+    for node in postorder(root):
+        if not node.children:
+            continue
+        default_ancestor = node.children[0]
+        for child in node.children:
+            left_sibling = child.left_sibling()
+            if left_sibling is not None:
+                prelim = left_sibling.prelim + distance(left_sibling, child)
+                if child.children:
+                    child.mod = prelim - child.prelim # child.prelim is the midpoint of its children
+                child.prelim = prelim
+            default_ancestor = apportion(child, default_ancestor)
+        execute_shifts(node)
+        node.prelim = (node.children[0].prelim + node.children[-1].prelim) / 2
+    stack = [(root, 0.0)]
+    while stack:
+        node, mod_sum = stack.pop()
+        node.x = node.prelim + mod_sum
+        mod_sum += node.mod
+        stack.extend((child, mod_sum) for child in node.children)
+
+def build_layout_tree(tables, edges, fontsize, horizontal):
+    """ Returns the root of a tree of Layout_Nodes of the rendered tables, a virtual root
+    above the nodes without a parent. """
+    nodes = {}
+    for node_id, table in enumerate(tables):
+        if table is not None:
+            attributes, lines = parse_table(table)
+            width = max(text_width(line, fontsize) for line in lines) + 2 * cell_padding
+            height = len(lines) * line_height * fontsize + 2 * cell_padding
+            nodes[node_id] = Layout_Node(node_id, attributes, lines, width, height, horizontal)
+    root = Layout_Node(None, None, [], 0, 0, horizontal)
+    for node_id1, node_id2 in edges:
+        if node_id1 in nodes and node_id2 in nodes:
+            child = nodes[node_id2]
+            child.parent = nodes[node_id1]
+    for node in nodes.values():
+        parent = node.parent
+        if parent is None:
+            node.parent = parent = root
+        node.number = len(parent.children)
+        parent.children.append(node)
+    return root
+
+def tree_to_svg(tables, edges, foreground_color, background_color, fontname, fontsize, horizontal=False):
+    """ Returns an SVG of the tree of node 'tables' (with colors filled in) connected by
+    'edges', a list of (parent node_id, child node_id), laid out as a tidy tree. """
+    fontsize = float(fontsize)
+    root = build_layout_tree(tables, edges, fontsize, horizontal)
+    tidy_layout(root)
+    nodes = postorder(root)[:-1] # without the virtual root
+    level_extents = {}
+    stack = [(child, 0) for child in root.children]
+    while stack:
+        node, depth = stack.pop()
+        node.depth = depth
+        level_extents[depth] = max(level_extents.get(depth, 0), node.extent)
+        stack.extend((child, depth+1) for child in node.children)
+    level_starts = []
+    position = margin
+    for depth in range(len(level_extents)):
+        level_starts.append(position)
+        position += level_extents[depth] + level_gap
+    depth_size = position - level_gap + margin
+    min_x = min((node.x - node.breadth/2 for node in nodes), default=0)
+    breadth_size = max((node.x + node.breadth/2 for node in nodes), default=0) - min_x + 2 * margin
+    for node in nodes:
+        breadth = node.x - node.breadth/2 - min_x + margin
+        if horizontal:
+            node.x, node.y = level_starts[node.depth], breadth
+        else:
+            node.x, node.y = breadth, level_starts[node.depth]
+    width, height = (depth_size, breadth_size) if horizontal else (breadth_size, depth_size)
+    out = [f'<?xml version="1.0" encoding="UTF-8" standalone="no"?>\n'
+           f'<svg xmlns="http://www.w3.org/2000/svg" width="{width:.0f}pt" height="{height:.0f}pt" '
+           f'viewBox="0 0 {width:.1f} {height:.1f}" font-family="{html.escape(fontname)}" font-size="{fontsize:g}">\n'
+           f'<defs><marker id="arrow" viewBox="0 0 10 10" refX="10" refY="5" markerWidth="7" markerHeight="7" orient="auto">'
+           f'<path d="M0,0 L10,5 L0,10 z" fill="{svg_color(foreground_color)}"/></marker></defs>\n'
+           f'<rect width="100%" height="100%" fill="{svg_color(background_color)}"/>\n']
+    for node in nodes:
+        for child in node.children:
+            if horizontal:
+                x1, y1 = node.x + node.width, node.y + node.height/2
+                x2, y2 = child.x, child.y + child.height/2
+            else:
+                x1, y1 = node.x + node.width/2, node.y + node.height
+                x2, y2 = child.x + child.width/2, child.y
+            out.append(f'<line x1="{x1:.1f}" y1="{y1:.1f}" x2="{x2:.1f}" y2="{y2:.1f}" '
+                       f'stroke="{svg_color(foreground_color)}" marker-end="url(#arrow)"/>\n')
+    for node in reversed(nodes):
+        out.append(node_to_svg(node, fontsize))
+    out.append('</svg>\n')
+    return ''.join(out)
+
+def svg_color(color):
+    return 'none' if color == 'transparent' else color
+
+def node_to_svg(node, fontsize):
+    attributes = node.attributes
+    color = svg_color(attributes.get('COLOR', '#000000'))
+    border = attributes.get('BORDER', '1')
+    out = [f'<g id="node{node.node_id}">'
+           f'<rect x="{node.x:.1f}" y="{node.y:.1f}" width="{node.width:.1f}" height="{node.height:.1f}" '
+           f'fill="{svg_color(attributes.get("BGCOLOR", "none"))}" stroke="{color}" stroke-width="{border}"/>\n']
+    x = node.x + cell_padding
+    y = node.y + cell_padding - 0.25 * fontsize
+    for line in node.lines:
+        y += line_height * fontsize
+        out.append(f'<text x="{x:.1f}" y="{y:.1f}" fill="{color}" xml:space="preserve">')
+        for text, is_bold, is_struck, text_color in line:
+            text = html.escape(text, quote=False)
+            if is_bold or is_struck or text_color:
+                style = ' font-weight="bold"' if is_bold else ''
+                style += ' text-decoration="line-through"' if is_struck else ''
+                style += f' fill="{text_color}"' if text_color else ''
+                text = f'<tspan{style}>{text}</tspan>'
+            out.append(text)
+        out.append('</text>\n')
+    out.append('</g>\n')
+    return ''.join(out)
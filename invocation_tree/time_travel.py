@@ -0,0 +1,163 @@
+import array
+import bisect
+import html
+
+import invocation_tree.event_log as event_log
+
+class Active_Node:
+    """ Stands in for the active Tree_Node of a step, for the viewport. """
+    __slots__ = ('node_id',)
+
+    def __init__(self, node_id):
+        self.node_id = node_id
+
+
+class Replay:
+    """ Time travel through a recorded run: renders the tree as it was at any step.
+
+    Indexing renders the tables of each step once and stores per step just the tables
+    that changed (the delta), and per node the steps at which its table changed. Seeking
+    updates just the nodes that changed between the current and the new step, each found
+    by bisecting its steps, or all nodes of the two steps if that is less work, and only
+    that step gets rendered. """
+
+    def __init__(self, filename, tree):
+        self.tree = tree
+        self.tables = [] # table_id -> table
+        self.edges = [] # (parent_id, child_id)
+        self.deltas = [] # per step: array of node_id, table_id pairs
+        self.change_counts = array.array('L') # per step: number of node changes up to and including it
+        self.edge_counts = array.array('L') # per step: number of edges
+        self.locations = [] # per step: (event, filename, line_nr)
+        self.active_ids = array.array('l') # per step: node_id of the active node, -1 if none
+        self.node_counts = array.array('L') # per step: number of nodes
+        self.node_steps = [] # per node_id: array of the steps its table changed
+        self.node_table_ids = [] # per node_id: array of its table_id from each of these steps
+        self.call_steps = {} # function name -> sorted step indices of its calls
+        self.shown = array.array('L') # table_id per node_id currently in 'tree', 0 is no table
+        self.index = -1 # current step
+        self.build_index(filename)
+
+    def __len__(self):
+        return len(self.deltas)
+
+    def __repr__(self):
+        return f'Replay(steps={len(self)}, index={self.index})'
+
+    def build_index(self, filename):
+        tree = self.tree
+        table_ids = {None: 0}
+        self.tables.append(None)
+        nodes = {}
+        change_count = 0
+        for step in event_log.read_steps(filename):
+            tree.replay_step(step, nodes)
+            self.edges.extend(step.edges)
+            changed = [n.node_id for n in (tree.paused + tree.prev_returned + tree.returned +
+                                           tree.stack[-1:] + tree.prev_paused)]
+            tree.update_tables()
+            delta = array.array('L')
+            for node_id in dict.fromkeys(changed):
+                table = tree.dot_source.tables[node_id]
+                table_id = table_ids.get(table)
+                if table_id is None:
+                    table_id = table_ids[table] = len(self.tables)
+                    self.tables.append(table)
+                delta.append(node_id)
+                delta.append(table_id)
+                while len(self.node_steps) <= node_id:
+                    self.node_steps.append(array.array('L'))
+                    self.node_table_ids.append(array.array('L'))
+                self.node_steps[node_id].append(len(self.deltas))
+                self.node_table_ids[node_id].append(table_id)
+            change_count += len(delta) // 2
+            self.deltas.append(delta)
+            self.change_counts.append(change_count)
+            self.edge_counts.append(len(self.edges))
+            self.locations.append((step.event, step.filename, step.line_nr))
+            self.active_ids.append(tree.stack[-1].node_id if tree.stack else -1)
+            self.node_counts.append(tree.node_count)
+            if step.event == 'call' and tree.stack:
+                name = html.unescape(tree.stack[-1].contents[0])
+                self.call_steps.setdefault(name, []).append(step.index)
+        tree.stack = []
+        tree.prev_returned = []
+        tree.prev_paused = []
+        for node_id in range(len(tree.dot_source.tables)): # start from an empty tree
+            tree.dot_source.remove_table(node_id)
+        tree.dot_source.remove_edges(0)
+        self.shown = array.array('L', bytes(len(self.node_steps) * self.shown.itemsize))
+
+    def table_id_at(self, node_id, index):
+        """ Returns the table_id of node 'node_id' at step 'index'. """
+        steps = self.node_steps[node_id]
+        i = bisect.bisect_right(steps, index)
+        return self.node_table_ids[node_id][i - 1] if i else 0
+
+    def changed_nodes(self, index):
+        """ Returns the node_ids whose table may differ between the current step and step 'index'. """
+        if self.index < 0:
+            return range(min(self.node_counts[index], len(self.node_steps)))
+        low, high = sorted((self.index, index))
+        node_count = min(max(self.node_counts[low], self.node_counts[high]), len(self.node_steps))
+        if self.change_counts[high] - self.change_counts[low] > node_count:
+            return range(node_count)
+        node_ids = set()
+        for delta in self.deltas[low + 1:high + 1]:
+            node_ids.update(delta[::2])
+        return node_ids
+
+    def seek(self, index):
+        """ Renders the tree at step 'index' (negative counts from the end) and returns its graph. """
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError(f'step {index} out of range, the recording has {len(self)} steps')
+        tree = self.tree
+        dot_source = tree.dot_source
+        shown = self.shown
+        for node_id in self.changed_nodes(index):
+            table_id = self.table_id_at(node_id, index)
+            if table_id != shown[node_id]:
+                if table_id == 0:
+                    dot_source.remove_table(node_id)
+                else:
+                    dot_source.set_table(node_id, self.tables[table_id])
+                shown[node_id] = table_id
+        edge_count = self.edge_counts[index]
+        dot_source.remove_edges(edge_count)
+        for parent_id, child_id in self.edges[len(dot_source.edges):edge_count]:
+            dot_source.add_edge(parent_id, child_id)
+        self.index = index
+        active_id = self.active_ids[index]
+        tree.stack = [] if active_id < 0 else [Active_Node(active_id)]
+        tree.node_count = self.node_counts[index]
+        tree.graph = tree.recolor_last_graph()
+        if tree.render and tree.graph is not None:
+            tree.render_graph(tree.graph)
+        return tree.graph
+
+    def location(self, index=None):
+        """ Returns (event, filename, line_nr) of step 'index', by default the current step. """
+        return self.locations[self.index if index is None else index]
+
+    def next(self):
+        """ Renders the next step, returns None at the end of the recording. """
+        if self.index + 1 >= len(self):
+            return None
+        return self.seek(self.index + 1)
+
+    def prev(self):
+        """ Renders the previous step, returns None at the start of the recording. """
+        if self.index <= 0:
+            return None
+        return self.seek(self.index - 1)
+
+    def next_call_of(self, name):
+        """ Renders the next step that calls function 'name' (as shown in the tree, like
+        'my_function' or 'My_Class.my_method'), returns None if there is none. """
+        call_steps = self.call_steps.get(name, [])
+        i = bisect.bisect_right(call_steps, self.index)
+        if i == len(call_steps):
+            return None
+        return self.seek(call_steps[i])
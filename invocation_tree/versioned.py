@@ -0,0 +1,138 @@
+import itertools
+
+version_counter = itertools.count(1) # shared, so no two versions are ever equal
+
+class Versioned_Set(set):
+    """ A set that gets a new 'version' on each mutation, so users can cheaply check
+    whether it changed since they last looked. """
+
+    def __init__(self, *args):
+        super().__init__(*args)
+        self.version = next(version_counter)
+
+    def changed(self):
+        self.version = next(version_counter)
+
+    def add(self, element):
+        super().add(element)
+        self.changed()
+
+    def discard(self, element):
+        super().discard(element)
+        self.changed()
+
+    def remove(self, element):
+        super().remove(element)
+        self.changed()
+
+    def pop(self):
+        element = super().pop()
+        self.changed()
+        return element
+
+    def clear(self):
+        super().clear()
+        self.changed()
+
+    def update(self, *others):
+        super().update(*others)
+        self.changed()
+
+    def difference_update(self, *others):
+        super().difference_update(*others)
+        self.changed()
+
+    def intersection_update(self, *others):
+        super().intersection_update(*others)
+        self.changed()
+
+    def symmetric_difference_update(self, other):
+        super().symmetric_difference_update(other)
+        self.changed()
+
+    def __ior__(self, other):
+        result = super().__ior__(other)
+        self.changed()
+        return result
+
+    def __iand__(self, other):
+        result = super().__iand__(other)
+        self.changed()
+        return result
+
+    def __isub__(self, other):
+        result = super().__isub__(other)
+        self.changed()
+        return result
+
+    def __ixor__(self, other):
+        result = super().__ixor__(other)
+        self.changed()
+        return result
+
+
+class Versioned_Dict(dict):
+    """ A dict that gets a new 'version' on each mutation, like Versioned_Set. """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.version = next(version_counter)
+
+    def changed(self):
+        self.version = next(version_counter)
+
+    def __setitem__(self, key, value):
+        super().__setitem__(key, value)
+        self.changed()
+
+    def __delitem__(self, key):
+        super().__delitem__(key)
+        self.changed()
+
+    def pop(self, *args):
+        value = super().pop(*args)
+        self.changed()
+        return value
+
+    def popitem(self):
+        item = super().popitem()
+        self.changed()
+        return item
+
+    def clear(self):
+        super().clear()
+        self.changed()
+
+    def update(self, *args, **kwargs):
+        super().update(*args, **kwargs)
+        self.changed()
+
+    def setdefault(self, key, default=None):
+        value = super().setdefault(key, default)
+        self.changed()
+        return value
+
+    def __ior__(self, other):
+        result = super().__ior__(other)
+        self.changed()
+        return result
+
+
+class Change_Tracker:
+    """ Tells if a container changed since the last check, by its 'version' if it has one
+    and otherwise by comparing with a copy. """
+
+    def __init__(self):
+        self.version = None
+        self.copy = None
+
+    def changed(self, container):
+        version = getattr(container, 'version', None)
+        if version is None:
+            if container == self.copy:
+                return False
+        elif version == self.version:
+            return False
+        self.version = version
+        self.copy = container.copy() if version is None else None
+        return True
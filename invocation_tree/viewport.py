@@ -0,0 +1,85 @@
+class View:
+    """ The part of the tree shown in viewport mode: 'nodes' as (dot_id, node_id) in display
+    order, node_id None for a placeholder that summarizes the calls left out, with the
+    number of those calls in 'placeholder_counts', and the 'edges' as (dot_id, dot_id). """
+
+    def __init__(self):
+        self.nodes = []
+        self.edges = []
+        self.placeholder_counts = {} # dot_id -> number of calls left out
+
+    def add_node(self, node_id, parent_id):
+        self.nodes.append((node_id, node_id))
+        if parent_id >= 0:
+            self.edges.append((parent_id, node_id))
+
+    def add_placeholder(self, dot_id, count, parent_id=-1, child_id=-1):
+        self.nodes.append((dot_id, None))
+        self.placeholder_counts[dot_id] = count
+        if parent_id >= 0:
+            self.edges.append((parent_id, dot_id))
+        if child_id >= 0:
+            self.edges.append((dot_id, child_id))
+
+def recent_children(store, node_id, history, limit):
+    """ Returns the last 'history' children of 'node_id' (-1 for the roots) before node_id
+    'limit' from old to new, and whether it has older children. """
+    children = []
+    child = store.last_root if node_id < 0 else store.last_child[node_id]
+    while child >= limit:
+        child = store.prev_sibling[child]
+    while child >= 0 and len(children) < history:
+        children.append(child)
+        child = store.prev_sibling[child]
+    children.reverse()
+    return children, child >= 0
+
+def add_children(view, store, node_id, levels, history, limit, path_child=-1):
+    """ Adds the recent children of 'node_id' and their recent children for 'levels' more
+    levels, except for the children of 'path_child' that are added by the caller. """
+    children, has_older = recent_children(store, node_id, history, limit)
+    if has_older:
+        view.add_placeholder(f'more{node_id}', children[0] - (node_id + 1), parent_id=node_id)
+    for child in children:
+        view.add_node(child, node_id)
+        end = min(store.end(child), limit)
+        if child == path_child or end == child + 1:
+            continue
+        if levels > 0:
+            add_children(view, store, child, levels - 1, history, limit)
+        else:
+            view.add_placeholder(f'more{child}', end - child - 1, parent_id=child)
+
+def view_around(store, anchor, radius, history, limit=None):
+    """ Returns the View of the nodes around node 'anchor', usually the active node: its
+    ancestors up to 'radius' levels up with their recent children, and its descendants up
+    to 'radius' levels down of which only the last 'history' children per node. Only the
+    nodes before node_id 'limit' are shown, to show an earlier step of a replay. Per step
+    the cost depends on 'radius' and 'history', not on the size of the tree. """
+    view = View()
+    if limit is None or limit > len(store):
+        limit = len(store)
+    if not 0 <= anchor < limit:
+        return view
+    path = [anchor]
+    while len(path) <= radius and store.parents[path[-1]] >= 0:
+        path.append(store.parents[path[-1]])
+    path.reverse()
+    top = path[0]
+    if store.parents[top] >= 0: # ancestors are left out
+        view.add_placeholder('above', top, child_id=top)
+        view.add_node(top, -1)
+    else:
+        add_children(view, store, -1, 0, history, limit, path_child=top)
+    for node_id, path_child in zip(path, path[1:]):
+        add_children(view, store, node_id, 0, history, limit, path_child=path_child)
+    end = min(store.end(anchor), limit)
+    if radius > 0:
+        add_children(view, store, anchor, radius - 1, history, limit)
+    elif end > anchor + 1:
+        view.add_placeholder(f'more{anchor}', end - anchor - 1, parent_id=anchor)
+    return view
+
+def placeholder_table(count, foreground_color, background_color):
+    return (f'<\n<TABLE BORDER="1" STYLE="dashed" COLOR={foreground_color} CELLBORDER="0" '
+            f'CELLSPACING="0" BGCOLOR={background_color}>\n  <TR><TD>… {count:,} more calls</TD></TR>\n</TABLE>>')
@@ -0,0 +1,30 @@
+import invocation_tree as ivt
+import invocation_tree.aggregation as aggregation
+
+def countdown(n):
+    if n > 0:
+        countdown(n - 1)
+
+def loop(calls):
+    for i in range(calls):
+        step(i)
+
+def step(i):
+    return i
+
+def test_sample_is_bounded_and_keeps_first_call():
+    tree = ivt.Invocation_Tree(render=False, show=False, block=False)
+    tree.aggregate = True
+    tree(loop, 1000)
+    step_node = tree.merged_nodes[(0, 'step')]
+    samples = step_node.aggregate.samples
+    assert len(samples) == aggregation.sample_size
+    assert samples[0] == (1, '(i=0)')
+    assert len({call for call, _ in samples}) == aggregation.sample_size
+    assert 'sample args (i=0) ' in tree.get_graph().source
+
+def test_sample_leaves_out_hidden_arguments():
+    tree = ivt.Invocation_Tree(render=False, show=False, block=False, hide_vars={'countdown.n'})
+    tree.aggregate = True
+    tree(countdown, 3)
+    assert 'sample args' not in tree.get_graph().source
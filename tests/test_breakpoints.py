@@ -0,0 +1,31 @@
+import invocation_tree as ivt
+
+def fib(n):
+    if n < 2:
+        return n
+    return fib(n-1) + fib(n-2)
+
+def blocking_tree(monkeypatch, commands=()):
+    commands = list(commands)
+    monkeypatch.setattr('builtins.input', lambda prompt: commands.pop(0) if commands else '')
+    tree = ivt.blocking()
+    tree.show = False
+    rendered = []
+    tree.render_graph = lambda graph: rendered.append(graph.source)
+    return tree, rendered
+
+def test_end_is_rendered_after_last_breakpoint(monkeypatch):
+    tree, rendered = blocking_tree(monkeypatch)
+    tree.add_breakpoint('fib', condition=lambda l: l['n'] == 3)
+    tree(fib, 4)
+    assert len(rendered) == 3 # call and return of fib(3), and the end
+    assert rendered[-1] == tree.get_graph().source
+    assert rendered[-1] != rendered[-2]
+
+def test_end_is_not_rendered_twice(monkeypatch):
+    tree, rendered = blocking_tree(monkeypatch)
+    tree(fib, 3)
+    steps = len(rendered)
+    tree, rendered = blocking_tree(monkeypatch, ['e'])
+    tree(fib, 3)
+    assert len(rendered) == 2 and steps > 2
@@ -0,0 +1,28 @@
+import invocation_tree as ivt
+
+def add(a, b):
+    c = a + b
+    return c
+
+def count_shown(tree, var):
+    return tree.get_graph().source.count(f'<B>{var}</B>')
+
+def test_constructor_keeps_hide_vars():
+    hide_vars = {'add.c'}
+    tree = ivt.Invocation_Tree(render=False, show=False, block=False, hide_vars=hide_vars)
+    assert tree.hide_vars is hide_vars
+    tree(add, 1, 2)
+    assert count_shown(tree, 'c') == 0 and count_shown(tree, 'b') == 1
+    hide_vars.add('add.b')
+    tree(add, 1, 2)
+    assert count_shown(tree, 'a') == 1 and count_shown(tree, 'b') == 0
+
+def test_constructor_keeps_to_string():
+    to_string = {'add.c': lambda c: 'seen'}
+    tree = ivt.Invocation_Tree(render=False, show=False, block=False, to_string=to_string)
+    assert tree.to_string is to_string
+    tree(add, 1, 2)
+    assert count_shown(tree, 'seen') == 1
+    to_string['add.c'] = lambda c: 'changed'
+    tree(add, 1, 2)
+    assert count_shown(tree, 'seen') == 0 and count_shown(tree, 'changed') == 1
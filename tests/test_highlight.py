@@ -0,0 +1,24 @@
+import invocation_tree as ivt
+
+def count(n):
+    total = 0
+    for i in range(n):
+        total += i
+    return total
+
+def test_highlight_cache_belongs_to_the_tree():
+    tree = ivt.non_blocking()
+    tree.each_line = True
+    tree.render_graph = lambda graph: None # create the graph each step, without rendering
+    tree.max_highlights = 5
+    tree(count, 20)
+    assert 0 < len(tree.highlights) <= tree.max_highlights
+    other = ivt.debugger_no_render()
+    assert other.highlights == {}
+    tree.start_trace() # a new run starts with an empty cache
+    tree.stop_trace()
+    assert tree.highlights == {}
+
+def test_highlight_diff():
+    assert ivt.highlight_diff('abc', 'abc') == ('abc', False)
+    assert ivt.highlight_diff('[1, 2]', '[1, 3]') == ('[1, <B>3&#8203;</B>&#8203;]', True)
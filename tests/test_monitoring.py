@@ -0,0 +1,80 @@
+import pytest
+
+import invocation_tree as ivt
+
+pytestmark = pytest.mark.skipif(not ivt.monitoring.has_monitoring, reason='sys.monitoring needs Python 3.12+')
+
+def leaf(n):
+    return n
+
+def helper(n):
+    if n > 0:
+        return helper(n - 1)
+    return leaf(n)
+
+def numbers(n):
+    for i in range(n):
+        yield leaf(i)
+
+def failing():
+    leaf(0)
+    raise ValueError('failing')
+
+def main(n):
+    total = leaf(n)
+    for i in range(3):
+        total += helper(i)
+    total += sum(numbers(3))
+    try:
+        failing()
+    except ValueError:
+        pass
+    return total + leaf(1)
+
+def traced_source(backend, ignore_calls=(), hide_calls=()):
+    tree = ivt.Invocation_Tree(render=False, show=False, block=False, backend=backend)
+    tree.ignore_calls.update(ignore_calls)
+    tree.hide_calls.update(hide_calls)
+    tree(main, 2)
+    return tree.get_graph().source
+
+def test_ignored_calls_match_settrace():
+    ignore_calls = {'helper', 'numbers', 'failing'}
+    assert traced_source('monitoring', ignore_calls) == traced_source('settrace', ignore_calls)
+
+def test_unhidden_call_is_shown_again():
+    traced_source('monitoring', hide_calls={'leaf'})
+    assert traced_source('monitoring') == traced_source('settrace')
+
+def test_decorated_call_after_hidden_run(monkeypatch):
+    traced_source('monitoring', hide_calls={'leaf'})
+    tree = ivt.Invocation_Tree(render=False, show=False, block=False, backend='monitoring')
+    monkeypatch.setattr(ivt, 'decorator_tree', tree)
+    assert ivt.show(leaf)(3) == 3
+    assert tree.node_count == 1
+
+def test_runs_leave_other_tools_alone():
+    monitoring = ivt.monitoring.sys.monitoring
+    tool_id = monitoring.COVERAGE_ID
+    if monitoring.get_tool(tool_id) is not None:
+        pytest.skip('the coverage tool id is in use')
+    calls = []
+
+    def py_start(code, offset):
+        if code is leaf.__code__:
+            calls.append(code)
+        return monitoring.DISABLE
+
+    monitoring.use_tool_id(tool_id, 'test')
+    monitoring.register_callback(tool_id, monitoring.events.PY_START, py_start)
+    monitoring.set_events(tool_id, monitoring.events.PY_START)
+    try:
+        leaf(0)
+        traced_source('monitoring', hide_calls={'helper'})
+        traced_source('monitoring', hide_calls={'helper', 'numbers'})
+        leaf(0)
+    finally:
+        monitoring.set_events(tool_id, 0)
+        monitoring.register_callback(tool_id, monitoring.events.PY_START, None)
+        monitoring.free_tool_id(tool_id)
+    assert len(calls) == 1
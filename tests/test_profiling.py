@@ -0,0 +1,20 @@
+import pytest
+
+import invocation_tree as ivt
+import invocation_tree.profiling as profiling
+
+@pytest.mark.parametrize('backend', ['settrace', 'monitoring'])
+def test_calibration_run_is_traced(backend):
+    if ivt.monitoring.select_backend(backend) != backend:
+        pytest.skip('sys.monitoring needs Python 3.12+')
+    tree = ivt.Invocation_Tree(render=False, show=False, block=False, backend=backend)
+    events = []
+
+    def count(frame, event, arg):
+        events.append(event)
+        return True
+
+    tree.trace = count
+    tree(profiling.calibration_run(), 100)
+    assert events.count('call') >= 101
+    assert events.count('return') >= 101
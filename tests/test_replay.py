@@ -0,0 +1,83 @@
+import gc
+import weakref
+
+import pytest
+
+import invocation_tree as ivt
+
+def fib(n):
+    if n < 2:
+        return n
+    return fib(n-1) + fib(n-2)
+
+def record(tmp_path):
+    log = str(tmp_path / 'tree.ivtlog')
+    tree = ivt.recording(log)
+    tree(fib, 6)
+    return log
+
+def node_ids(source):
+    return {line.split()[0] for line in source.splitlines() if '[label=' in line}
+
+def test_replay_fills_call_store(tmp_path):
+    log = record(tmp_path)
+    traced = ivt.debugger_no_render()
+    traced(fib, 6)
+    replayed = ivt.Invocation_Tree(render=False, show=False, block=False)
+    replayed.replay(log)
+    assert list(replayed.call_store.parents) == list(traced.call_store.parents)
+    assert list(replayed.call_store.ends) == list(traced.call_store.ends)
+    assert replayed.call_store.names == traced.call_store.names
+
+def test_replay_with_viewport(tmp_path):
+    log = record(tmp_path)
+    tree = ivt.Invocation_Tree(render=False, show=False, block=False)
+    tree.viewport = True
+    tree.viewport_radius = 1
+    tree.replay(log)
+    assert '0' in node_ids(tree.get_graph().source)
+
+def test_seek_with_viewport(tmp_path):
+    log = record(tmp_path)
+    replay = ivt.replay_recording(log)
+    replay.tree.render = False
+    replay.tree.viewport = True
+    replay.tree.viewport_radius = 1
+    assert node_ids(replay.seek(0).source) == {'0'}
+    shown = node_ids(replay.seek(2).source)
+    assert '2' in shown and shown <= {'above', '0', '1', '2'}
+    assert '0' in node_ids(replay.seek(-1).source)
+
+def test_export_after_replay(tmp_path):
+    log = record(tmp_path)
+    traced = ivt.debugger_no_render()
+    traced(fib, 6)
+    traced.export_collapsed(str(tmp_path / 'traced.txt'))
+    replayed = ivt.Invocation_Tree(render=False, show=False, block=False)
+    replayed.replay(log)
+    replayed.export_collapsed(str(tmp_path / 'replayed.txt'))
+    collapsed = (tmp_path / 'replayed.txt').read_text()
+    assert collapsed and collapsed == (tmp_path / 'traced.txt').read_text()
+
+def test_export_of_streaming_tree_raises(tmp_path):
+    tree = ivt.streaming(str(tmp_path / 'spans.jsonl'))
+    tree(fib, 4)
+    with pytest.raises(ValueError):
+        tree.export_speedscope(str(tmp_path / 'tree.speedscope.json'))
+
+def test_seek_in_any_order(tmp_path):
+    log = record(tmp_path)
+    replay = ivt.replay_recording(log)
+    replay.tree.render = False
+    forward = [replay.seek(i).source for i in range(len(replay))]
+    for i in [len(replay) - 1, 0, 5, 4, len(replay) // 2, 1, 3]:
+        assert replay.seek(i).source == forward[i]
+
+def test_closed_recorder_is_not_kept_alive(tmp_path):
+    recorder = ivt.event_log.Recorder(str(tmp_path / 'tree.ivtlog'))
+    assert recorder in ivt.event_log.live_recorders
+    recorder.close()
+    assert recorder not in ivt.event_log.live_recorders
+    collected = weakref.ref(ivt.event_log.Recorder(str(tmp_path / 'other.ivtlog')))
+    gc.collect()
+    assert collected() is None
@@ -0,0 +1,36 @@
+import gc
+import json
+import weakref
+
+import invocation_tree as ivt
+import invocation_tree.span_export as span_export
+
+def fib(n):
+    if n < 2:
+        return n
+    return fib(n-1) + fib(n-2)
+
+def test_spans_are_written(tmp_path):
+    filename = tmp_path / 'spans.jsonl'
+    tree = ivt.streaming(str(filename))
+    tree(fib, 4)
+    spans = [json.loads(line) for line in filename.read_text().splitlines()]
+    assert [span['type'] for span in spans].count('begin') == 9
+    assert [span['type'] for span in spans].count('end') == 9
+
+def test_closed_writer_is_not_kept_alive(tmp_path):
+    writer = span_export.Span_Writer(str(tmp_path / 'spans.json'))
+    writer.write({'name': 'fib'})
+    writer.close()
+    assert writer not in span_export.live_writers
+    assert (tmp_path / 'spans.json').read_text() == '[\n{"name": "fib"}'
+    collected = weakref.ref(span_export.Span_Writer(str(tmp_path / 'other.json')))
+    gc.collect()
+    assert collected() is None
+
+def test_new_writer_closes_the_previous(tmp_path):
+    tree = ivt.Invocation_Tree(render=False, show=False, block=False)
+    tree.stream_spans(str(tmp_path / 'first.jsonl'))
+    first = tree.span_writer
+    tree.stream_spans(str(tmp_path / 'second.jsonl'))
+    assert first not in span_export.live_writers